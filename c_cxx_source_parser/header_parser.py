@@ -1,9 +1,19 @@
 import sys
+import ctypes
 import os
 import sqlite3
 import argparse
 import time
-from clang.cindex import Index, Config, CursorKind, TypeKind, TranslationUnit, StorageClass
+import json
+import functools
+import contextlib
+import hashlib
+import glob
+import mmap
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from clang.cindex import Index, Config, CursorKind, TypeKind, TranslationUnit, StorageClass, TranslationUnitLoadError, TranslationUnitSaveError, SourceLocation, conf, callbacks
 import clang.cindex
 
 # --- グローバル変数 ---
@@ -14,380 +24,632 @@ import clang.cindex
 LIBCLANG_PATH = None 
 # LIBCLANG_PATH = '/path/to/libclang.so' # Linux の例
 # LIBCLANG_PATH = '/path/to/libclang.dylib' # macOS の例
+# ディレクトリが指定された場合に解析対象とするヘッダファイルの拡張子
+INPUT_EXTENSIONS = ('.h', '.hpp', '.hxx', '.hh')
 
 # --- データベース関連 ---
 
+# DBヘルパー (add_file_records, clear_definitions_for_file(s), insert_definitions) はコミットしない。
+# 呼び出し側が with conn: でファイル群の処理全体を1トランザクションにまとめ、成功時にコミット、例外時にロールバックする。
+
+# 定義を格納するテーブル (files 以外)
+DEFINITION_TABLES = ['macros', 'functions', 'structs_unions', 'enums', 'typedefs', 'variables']
+# 定義削除用のSQL (呼び出し毎に文字列を組み立てず、SQLiteのステートメントキャッシュに乗せる)
+CLEAR_DEFINITIONS_SQL = [
+    f"DELETE FROM {table} WHERE file_id IN (SELECT value FROM json_each(?))"
+    for table in DEFINITION_TABLES
+]
+# traverse_ast が収集した行の挿入SQL (テーブルごとに executemany で使う)
+INSERT_DEFINITION_SQL = {
+    'macros': "INSERT INTO macros (file_id, name, body, location) VALUES (?, ?, ?, ?)",
+    'functions': "INSERT INTO functions (file_id, name, return_type, parameters, is_declaration, location) VALUES (?, ?, ?, ?, ?, ?)",
+    'structs_unions': "INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
+    'enums': "INSERT INTO enums (file_id, name, constants, location) VALUES (?, ?, ?, ?)",
+    'typedefs': "INSERT INTO typedefs (file_id, name, underlying_type, location) VALUES (?, ?, ?, ?)",
+    'variables': "INSERT INTO variables (file_id, name, type, is_extern, location) VALUES (?, ?, ?, ?, ?)",
+}
+# ファイルの登録/更新を1文で行うUPSERT ([パス, 内容ハッシュ] の組をJSON配列で渡し、全ファイルのIDを RETURNING で受け取る)
+# INSERT ... SELECT と ON CONFLICT を併用する場合、構文の曖昧さを避けるため WHERE true が必要
+UPSERT_FILES_SQL = """
+    INSERT INTO files (filepath, last_parsed_at, content_hash)
+    SELECT json_extract(value, '$[0]'), ?, json_extract(value, '$[1]') FROM json_each(?) WHERE true
+    ON CONFLICT (filepath) DO UPDATE SET last_parsed_at = excluded.last_parsed_at, content_hash = excluded.content_hash
+    RETURNING id, filepath
+"""
+# 前回解析時の内容ハッシュの取得 (パスはJSON配列で渡す)
+SELECT_CONTENT_HASHES_SQL = "SELECT filepath, content_hash FROM files WHERE filepath IN (SELECT value FROM json_each(?))"
+# os.path.abspath のメモ化版 (同じパスが何度も現れる場合の getcwd/正規化を省く)
+# 相対パスの結果はカレントディレクトリに依存するため、os.chdir した場合は cached_abspath.cache_clear() を呼ぶこと
+cached_abspath = functools.lru_cache(maxsize=8192)(os.path.abspath)
+# 接続時に設定するPRAGMA
+# WALモードでは読み取り側が解析中の書き込みをブロックせず、コミット毎のfsyncも減る
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MiB
+    "PRAGMA mmap_size=268435456",    # 256 MiB
+    "PRAGMA foreign_keys=ON",
+]
+# 複数ファイルの一括登録中は削除しておき、最後にまとめて作り直す検索用インデックス
+# file_id のインデックスは再解析時の DELETE で使うため残す
+BULK_LOAD_SUSPENDED_INDEXES = ['idx_macro_name', 'idx_func_name', 'idx_struct_name', 'idx_enum_name', 'idx_typedef_name', 'idx_var_name']
+
+def connect(db_path):
+    """PRAGMAを設定済みのSQLite接続を開く (全パーサで同じ設定を共有する)"""
+    conn = sqlite3.connect(db_path, check_same_thread=False) # background_writer のスレッドからも使う
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# テーブルとインデックスを作成するDDL (executescript で1回のスクリプトとして実行する)
+SCHEMA_SQL = """
+    -- ファイル管理テーブル
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filepath TEXT UNIQUE NOT NULL,
+        last_parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        content_hash TEXT -- 前回解析時のファイル内容と解析設定のSHA-256 (--skip-unchanged で使う。それ以外の実行では NULL)
+    );
+
+    -- マクロ定義テーブル
+    CREATE TABLE IF NOT EXISTS macros (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        body TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    -- インデックスを作成 (検索高速化のため)
+    CREATE INDEX IF NOT EXISTS idx_macro_name ON macros (name);
+
+    -- 関数定義テーブル
+    CREATE TABLE IF NOT EXISTS functions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        return_type TEXT,
+        parameters TEXT, -- パラメータは単純なテキストとして保存 (例: "int a, const char* b")
+        is_declaration INTEGER DEFAULT 1, -- 1: 宣言, 0: 定義 (ヘッダでは主に宣言)
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_func_name ON functions (name);
+
+    -- 構造体/共用体定義テーブル
+    CREATE TABLE IF NOT EXISTS structs_unions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        kind TEXT NOT NULL, -- 'struct' or 'union'
+        name TEXT,         -- 匿名の場合は NULL
+        members TEXT,      -- メンバは単純なテキストとして保存 (例: "int x; float y;")
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_struct_name ON structs_unions (name);
+
+    -- 列挙型定義テーブル
+    CREATE TABLE IF NOT EXISTS enums (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT,         -- 匿名の場合は NULL
+        constants TEXT,    -- 定数は単純なテキストとして保存 (例: "RED=1, GREEN, BLUE=5")
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_enum_name ON enums (name);
+
+    -- Typedef定義テーブル
+    CREATE TABLE IF NOT EXISTS typedefs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        underlying_type TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_typedef_name ON typedefs (name);
+
+    -- グローバル変数定義テーブル
+    CREATE TABLE IF NOT EXISTS variables (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT,
+        is_extern INTEGER DEFAULT 0,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_var_name ON variables (name);
+
+    -- file_id のインデックス (再解析時の DELETE ... WHERE file_id がテーブル全走査にならないように)
+""" + "".join(
+    f"    CREATE INDEX IF NOT EXISTS idx_{table}_file_id ON {table} (file_id);\n"
+    for table in DEFINITION_TABLES
+)
+
 def setup_database(db_path):
     """SQLiteデータベースをセットアップし、テーブルを作成する"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # ファイル管理テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filepath TEXT UNIQUE NOT NULL,
-            last_parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # マクロ定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS macros (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            body TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    # インデックスを作成 (検索高速化のため)
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_macro_name ON macros (name)')
-
-
-    # 関数定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS functions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            return_type TEXT,
-            parameters TEXT, -- パラメータは単純なテキストとして保存 (例: "int a, const char* b")
-            is_declaration INTEGER DEFAULT 1, -- 1: 宣言, 0: 定義 (ヘッダでは主に宣言)
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_func_name ON functions (name)')
-
-
-    # 構造体/共用体定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS structs_unions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            kind TEXT NOT NULL, -- 'struct' or 'union'
-            name TEXT,         -- 匿名の場合は NULL
-            members TEXT,      -- メンバは単純なテキストとして保存 (例: "int x; float y;")
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_struct_name ON structs_unions (name)')
-
-
-    # 列挙型定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS enums (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT,         -- 匿名の場合は NULL
-            constants TEXT,    -- 定数は単純なテキストとして保存 (例: "RED=1, GREEN, BLUE=5")
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_enum_name ON enums (name)')
-
-
-    # Typedef定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS typedefs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            underlying_type TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_typedef_name ON typedefs (name)')
-
-
-    # グローバル変数定義テーブル
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS variables (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            type TEXT,
-            is_extern INTEGER DEFAULT 0,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_var_name ON variables (name)')
-
-
-    conn.commit()
+    conn = connect(db_path)
+    # 全DDLを1トランザクションで実行する
+    conn.executescript(f"BEGIN;\n{SCHEMA_SQL}COMMIT;")
+    # content_hash 列がない以前のバージョンのDBには列を追加する
+    if 'content_hash' not in {row[1] for row in conn.execute("PRAGMA table_info(files)")}:
+        with conn:
+            conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
     return conn
 
-def clear_definitions_for_file(conn, file_id):
+def save_database(conn, db_path):
+    """メモリ上のDBを db_path に書き出す (Connection.backup でページ単位にまとめてコピーする)"""
+    disk_conn = connect(db_path)
+    try:
+        conn.backup(disk_conn)
+    finally:
+        disk_conn.close()
+
+def begin_bulk(conn):
+    """一括書き込み用のトランザクションを開始する (既に開始済みなら何もしない)"""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+@contextlib.contextmanager
+def suspended_indexes(conn, index_names):
+    """with ブロックの間だけインデックスを削除し、抜けるときに元の定義で作り直す"""
+    placeholders = ', '.join('?' * len(index_names))
+    index_sqls = conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND name IN ({placeholders})",
+        index_names).fetchall()
+    for name in index_names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        for (sql,) in index_sqls:
+            conn.execute(sql)
+
+def clear_definitions_for_files(conn, file_ids, cursor=None):
+    """複数のファイルIDに関連する定義をまとめてDBから削除する (コミットは呼び出し側で行う)"""
+    if cursor is None:
+        cursor = conn.cursor()
+    # IDの配列をJSONで渡し、テーブルごとに1回のDELETEで済ませる
+    file_ids_json = json.dumps(list(file_ids))
+    for sql in CLEAR_DEFINITIONS_SQL:
+        cursor.execute(sql, (file_ids_json,))
+
+def clear_definitions_for_file(conn, file_id, cursor=None):
     """特定のファイルIDに関連する定義をDBから削除する"""
-    cursor = conn.cursor()
-    tables = ['macros', 'functions', 'structs_unions', 'enums', 'typedefs', 'variables']
-    for table in tables:
-        cursor.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
-    conn.commit()
-
-def add_file_record(conn, filepath):
-    """ファイルをDBに記録し、既存の場合は更新、新規の場合は挿入してIDを返す"""
-    cursor = conn.cursor()
-    filepath_abs = os.path.abspath(filepath)
+    clear_definitions_for_files(conn, [file_id], cursor)
+
+def file_content_hash(filepath, parse_settings=()):
+    """ファイル内容と解析設定のSHA-256を返す (mmapで読み、Python側へのコピーを避ける)
+
+    parse_settings: 解析結果を左右する設定 (Clang引数・マクロ収集の有無など)。
+    内容が同じでも設定が変われば別のハッシュになり、--skip-unchanged で飛ばされない。
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > 0: # 空ファイルは mmap できない
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data)
+    for setting in parse_settings:
+        digest.update(b"\0" + setting.encode())
+    return digest.hexdigest()
+
+def get_stored_content_hashes(conn, filepaths, cursor=None):
+    """登録済みファイルの前回解析時の内容ハッシュを {絶対パス: ハッシュ} で返す"""
+    if cursor is None:
+        cursor = conn.cursor()
+    filepaths_abs = [cached_abspath(filepath) for filepath in filepaths]
+    cursor.execute(SELECT_CONTENT_HASHES_SQL, (json.dumps(filepaths_abs),))
+    return dict(cursor.fetchall())
+
+def add_file_records(conn, filepaths, cursor=None, content_hashes=None):
+    """複数のファイルを1トランザクションでDBに記録し、入力順のファイルIDリストを返す
+
+    既存ファイルは更新日時を更新して定義をクリアし、新規ファイルは挿入する。
+    content_hashes ({絶対パス: 内容ハッシュ}) を渡すと files.content_hash に保存する。
+    コミットは呼び出し側で行う。
+    """
+    if cursor is None:
+        cursor = conn.cursor()
+    filepaths_abs = [cached_abspath(filepath) for filepath in filepaths]
+    unique_filepaths = list(dict.fromkeys(filepaths_abs))
     now = time.strftime('%Y-%m-%d %H:%M:%S')
 
-    cursor.execute("SELECT id FROM files WHERE filepath = ?", (filepath_abs,))
-    result = cursor.fetchone()
-
-    if result:
-        file_id = result[0]
-        cursor.execute("UPDATE files SET last_parsed_at = ? WHERE id = ?", (now, file_id))
-        print(f"Updating records for file: {filepath_abs} (ID: {file_id})")
-        # 既存の定義をクリア
-        clear_definitions_for_file(conn, file_id)
-    else:
-        cursor.execute("INSERT INTO files (filepath, last_parsed_at) VALUES (?, ?)", (filepath_abs, now))
-        file_id = cursor.lastrowid
-        print(f"Adding new record for file: {filepath_abs} (ID: {file_id})")
-
-    conn.commit()
-    return file_id
+    begin_bulk(conn)
+    # パスごとの事前SELECTはせず、UPSERTを先に実行する
+    # id は AUTOINCREMENT なので、実行前の最大IDより大きいものが新規、それ以外が既存ファイル
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM files")
+    max_existing_id = cursor.fetchone()[0]
+
+    # 新規は挿入、既存は更新日時を更新し、全ファイルのIDを受け取る
+    content_hashes = content_hashes or {}
+    file_entries = [[filepath, content_hashes.get(filepath)] for filepath in unique_filepaths]
+    cursor.execute(UPSERT_FILES_SQL, (now, json.dumps(file_entries)))
+    file_ids = {filepath: file_id for file_id, filepath in cursor.fetchall()}
+    existing_file_ids = {
+        filepath: file_ids[filepath] for filepath in unique_filepaths
+        if file_ids[filepath] <= max_existing_id
+    }
+
+    for filepath, file_id in existing_file_ids.items():
+        print(f"Updating records for file: {filepath} (ID: {file_id})")
+    # 既存の定義をクリア
+    clear_definitions_for_files(conn, existing_file_ids.values(), cursor)
+
+    for filepath in unique_filepaths:
+        if filepath not in existing_file_ids:
+            print(f"Adding new record for file: {filepath} (ID: {file_ids[filepath]})")
+
+    return [file_ids[filepath] for filepath in filepaths_abs]
+
+def add_file_record(conn, filepath, cursor=None):
+    """ファイルをDBに記録し、既存の場合は更新、新規の場合は挿入してIDを返す"""
+    return add_file_records(conn, [filepath], cursor)[0]
 
 # --- Clang AST 解析 ---
 
 def get_macro_body(cursor:clang.cindex.Cursor):
     """マクロの本体を取得する試み"""
-    tokens = list(cursor.get_tokens())
-    if len(tokens) > 1:
-        # 最初のトークン（マクロ名）を除き、残りを結合
-        # トークン間のスペースを保持するように試みる
-        body = ""
-        last_token_end = tokens[0].extent.end.column
-        for i in range(1, len(tokens)):
-            token = tokens[i]
-            space = " " * max(0, token.extent.start.column - last_token_end)
-            body += space + token.spelling
-            last_token_end = token.extent.end.column
-        return body.strip()
-    return None # 本体がないか、取得失敗
+    # トークンはリストに展開せず、イテレータのまま順に読む
+    tokens = cursor.get_tokens()
+    first_token = next(tokens, None)
+    if first_token is None:
+        return None # 取得失敗
+    # 最初のトークン（マクロ名）を除き、残りを結合
+    # トークン間のスペースを保持するように試みる (部品をリストに溜めて最後に1回だけ結合)
+    parts = []
+    last_token_end = first_token.extent.end.column
+    for token in tokens:
+        extent = token.extent
+        gap = extent.start.column - last_token_end
+        if gap > 0: # 隣接するトークン (例: "(x)") では空文字を追加しない
+            parts.append(" " * gap)
+        parts.append(token.spelling)
+        last_token_end = extent.end.column
+    if not parts:
+        return None # 本体がない
+    return "".join(parts).strip()
 
 def get_function_params(cursor:clang.cindex.Cursor):
     """関数のパラメータリストを文字列として取得する"""
-    params = []
-    for arg in cursor.get_arguments():
-        param_type = arg.type.spelling
-        param_name = arg.spelling
-        params.append(f"{param_type} {param_name}".strip())
+    try:
+        # 引数名がない場合もある (例: void func(int);) ので、そのときは型だけにする (strip で末尾の空白を削るより安い)
+        params = [
+            f"{arg.type.spelling} {arg_name}" if (arg_name := arg.spelling) else arg.type.spelling
+            for arg in cursor.get_arguments()
+        ]
+    except Exception as e:
+        print(f"Warning: Could not get arguments for {cursor.spelling}: {e}", file=sys.stderr)
+        # 型情報からパラメータを取得するフォールバック (引数名は仮のもの)
+        func_type = cursor.type
+        if func_type.kind not in (TypeKind.FUNCTIONPROTO, TypeKind.FUNCTIONNOPROTO):
+            return ""
+        params = [f"{arg_type.spelling} arg{i+1}" for i, arg_type in enumerate(func_type.argument_types())]
     return ", ".join(params)
 
-def get_struct_union_members(cursor:clang.cindex.Cursor):
-    """構造体/共用体のメンバを文字列として取得する"""
-    members = []
-    for child in cursor.get_children():
-        if child.kind == CursorKind.FIELD_DECL:
-            members.append(f"{child.type.spelling} {child.spelling};")
-        # ネストされた構造体/共用体/enumなどの扱いはここでは省略
-    return " ".join(members)
-
-def get_enum_constants(cursor:clang.cindex.Cursor):
-    """列挙型の定数を文字列として取得する"""
-    constants = []
-    for child in cursor.get_children():
-        if child.kind == CursorKind.ENUM_CONSTANT_DECL:
-            const_name = child.spelling
-            const_val = child.enum_value
-            constants.append(f"{const_name}={const_val}") # 値も取得
-            #constants.append(const_name) # 名前だけの場合
-    return ", ".join(constants)
-
+def get_struct_union_members(cursor:clang.cindex.Cursor, children=None):
+    """構造体/共用体のメンバを文字列として取得する
+
+    children: 呼び出し側で取得済みの子カーソル (traverse_ast が走査用のリストを共有し、get_children() の再呼び出しを避ける)
+    """
+    field_decl = CursorKind.FIELD_DECL.value # 生の種類の値で比べる (get_enum_constants と同じ)
+    # ネストされた構造体/共用体/enumなどの扱いはここでは省略
+    return " ".join(
+        f"{child.type.spelling} {child.spelling};"
+        for child in (cursor.get_children() if children is None else children) if child._kind_id == field_decl
+    )
+
+def get_enum_constants(cursor:clang.cindex.Cursor, children=None):
+    """列挙型の定数を文字列として取得する (children は get_struct_union_members と同じ)"""
+    # 種類はカーソル構造体の生の値 (_kind_id) で比べ、定数ごとの Cursor.kind (CursorKind.from_id) を避ける
+    enum_constant_decl = CursorKind.ENUM_CONSTANT_DECL.value
+    return ", ".join(
+        f"{child.spelling}={child.enum_value}" # 値も取得 (名前だけの場合は child.spelling のみ)
+        for child in (cursor.get_children() if children is None else children) if child._kind_id == enum_constant_decl
+    )
+
+
+def new_definition_rows():
+    """traverse_ast が収集する行の入れ物を作る (テーブル名 -> {重複判定キー: 行タプル})"""
+    return {table: {} for table in DEFINITION_TABLES}
+
+TRANSLATION_UNIT_KIND_ID = CursorKind.TRANSLATION_UNIT.value
+# Value stored in structs_unions.kind for each raw cursor kind id (looked up via cursor._kind_id)
+STRUCT_UNION_KIND_NAMES = {CursorKind.STRUCT_DECL.value: 'struct', CursorKind.UNION_DECL.value: 'union'}
+
+def collect_macro(cursor, file_id, file_basename, rows, children):
+    """MACRO_DEFINITION -> macros"""
+    # libclang may not properly get function-like macro bodies
+    # Either get just the macro name, or try with get_tokens
+    name = cursor.spelling or None
+    if name: # Ignore macros without names (e.g., just #define)
+        body = get_macro_body(cursor) or ""
+        loc = cursor.location
+        location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+        rows['macros'][name] = (file_id, name, body, location)
+
+def collect_function(cursor, file_id, file_basename, rows, children):
+    """FUNCTION_DECL -> functions (definitions only)"""
+    # Check first: most functions in a header are declarations, whose details are never stored
+    if not cursor.is_definition():
+        return
+    name = cursor.spelling or None
+    return_type = sys.intern(cursor.result_type.spelling or "")
+    params = get_function_params(cursor) or ""
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+    is_declaration = 0 # Only definitions get this far
+    rows['functions'][name] = (file_id, name, return_type, params, is_declaration, location)
+
+def collect_struct_union(cursor, file_id, file_basename, rows, children):
+    """STRUCT_DECL / UNION_DECL -> structs_unions (definitions only)"""
+    # Ensure it's a definition (not just declaration)
+    if not cursor.is_definition():
+        return
+    name = cursor.spelling or None # May be anonymous struct/union
+    kind = STRUCT_UNION_KIND_NAMES[cursor._kind_id]
+    members = get_struct_union_members(cursor, children) or ""
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+    rows['structs_unions'][(name, kind)] = (file_id, kind, name, members, location)
+
+def collect_enum(cursor, file_id, file_basename, rows, children):
+    """ENUM_DECL -> enums (definitions only)"""
+    # Ensure it's a definition (not just declaration)
+    if not cursor.is_definition():
+        return
+    name = cursor.spelling or None # May be anonymous enum
+    constants = get_enum_constants(cursor, children) or ""
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+    rows['enums'][name] = (file_id, name, constants, location)
+
+def collect_typedef(cursor, file_id, file_basename, rows, children):
+    """TYPEDEF_DECL -> typedefs"""
+    name = cursor.spelling or None
+    underlying_type = sys.intern(cursor.underlying_typedef_type.spelling or "")
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+    rows['typedefs'][name] = (file_id, name, underlying_type, location)
+
+def collect_variable(cursor, file_id, file_basename, rows, children):
+    """VAR_DECL -> variables (file scope only)"""
+    # Only handle file-scope variables (global variables and static variables)
+    # Local variables in functions have cursor.semantic_parent.kind as FUNCTION_DECL
+    # The lexical parent (free from the walker) is not enough: int C::member = 1; is
+    # written at file scope but belongs to the class.
+    # Compare the raw kind id (Cursor.kind would look it up again via CursorKind.from_id)
+    if cursor.semantic_parent._kind_id != TRANSLATION_UNIT_KIND_ID:
+        return
+    name = cursor.spelling or None
+    var_type = sys.intern(cursor.type.spelling or "")
+    is_extern = 1 if cursor.storage_class == StorageClass.EXTERN else 0
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}" if loc else "unknown"
+    rows['variables'][name] = (file_id, name, var_type, is_extern, location)
+
+# Cursor kind -> collect_* function (one dict lookup per node instead of an if/elif chain)
+DEFINITION_HANDLERS = {
+    CursorKind.MACRO_DEFINITION: collect_macro,
+    CursorKind.FUNCTION_DECL: collect_function,
+    CursorKind.STRUCT_DECL: collect_struct_union,
+    CursorKind.UNION_DECL: collect_struct_union,
+    CursorKind.ENUM_DECL: collect_enum,
+    CursorKind.TYPEDEF_DECL: collect_typedef,
+    CursorKind.VAR_DECL: collect_variable,
+}
+
+# Kinds whose subtrees never hold a definition we record (bodies, initializers,
+# parameters, enum constants, type references), so the walk does not enter them.
+# A typedef's inline struct is also a sibling of the typedef, so it is still found.
+LEAF_KINDS = frozenset(kind.value for kind in (
+    CursorKind.FUNCTION_DECL,
+    CursorKind.CXX_METHOD,
+    CursorKind.CONSTRUCTOR,
+    CursorKind.DESTRUCTOR,
+    CursorKind.CONVERSION_FUNCTION,
+    CursorKind.FUNCTION_TEMPLATE,
+    CursorKind.VAR_DECL,
+    CursorKind.FIELD_DECL,
+    CursorKind.ENUM_DECL,
+    CursorKind.TYPEDEF_DECL,
+    CursorKind.TYPE_ALIAS_DECL,
+))
+
+# Return values of a clang_visitChildren visitor (CXChildVisitResult)
+CHILD_VISIT_BREAK = 0
+CHILD_VISIT_CONTINUE = 1
+CHILD_VISIT_RECURSE = 2
+
+# Kinds whose handler reads the children passed by traverse_ast (members, enum constants);
+# every other handler gets () so no child list is built for it
+CHILDREN_READ_KINDS = frozenset(kind.value for kind in (
+    CursorKind.STRUCT_DECL,
+    CursorKind.UNION_DECL,
+    CursorKind.ENUM_DECL,
+))
+
+# Records whose members traverse_ast walks from the child list it already built
+RECORD_KINDS = frozenset(kind.value for kind in (
+    CursorKind.STRUCT_DECL,
+    CursorKind.UNION_DECL,
+))
+
+@functools.lru_cache(maxsize=None)
+def main_file_check():
+    """Return libclang's clang_Location_isFromMainFile with its prototype declared.
+
+    clang.cindex does not wrap this function, so argtypes/restype are set here
+    once per process rather than on every traverse_ast call.
+    """
+    is_from_main_file = conf.lib.clang_Location_isFromMainFile
+    is_from_main_file.argtypes = [SourceLocation]
+    is_from_main_file.restype = ctypes.c_int
+    return is_from_main_file
 
 def traverse_ast(
         cursor:clang.cindex.Cursor,
-        db_conn:sqlite3.Connection,
         file_id:int,
-        target_filepath:str
+        target_filepath:str,
+        rows:dict
         ) -> None:
-    """Recursively traverse the AST and add definitions to the database"""
-    db_cursor = db_conn.cursor()
-
-    # Check if the cursor is in the target file (exclude included headers)
-    # Location may be None for CursorKind like UNEXPOSED_DECL
-    if cursor.location and cursor.location.file and \
-       os.path.abspath(cursor.location.file.name) != target_filepath:
-        return # This cursor is not in target file
-    # Debugging: Display current cursor type and name
-    # print(f"Visiting: {cursor.kind} - {cursor.spelling} at {cursor.location}")
-
-    # --- Process various definitions ---
-
-    if cursor.kind == CursorKind.MACRO_DEFINITION:
-        # libclang may not properly get function-like macro bodies
-        # Either get just the macro name, or try with get_tokens
-        name = cursor.spelling or None
-        body = get_macro_body(cursor) or ""
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Check if this macro already exists for the file_id and name
-        db_cursor.execute("SELECT id FROM macros WHERE file_id = ? AND name = ?", (file_id, name))
-        existing_macro = db_cursor.fetchone()
-        if existing_macro:
-            # Update the existing record
-            db_cursor.execute("UPDATE macros SET body=?, location=? WHERE id=?", (body, location, existing_macro[0]))
-        else:
-            if name: # Ignore macros without names (e.g., just #define)
-                db_cursor.execute("INSERT INTO macros (file_id, name, body, location) VALUES (?, ?, ?, ?)",
-                                (file_id, name, body, location))
-
-    elif cursor.kind == CursorKind.FUNCTION_DECL:
-        name = cursor.spelling or None  # May be anonymous struct
-        return_type = cursor.result_type.spelling or ""
-        params = get_function_params(cursor) or ""
-        is_declaration = 1 if not cursor.is_definition() else 0
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Check for existing function
-        if cursor.is_definition(): # Record only struct definitions (with content)
-            db_cursor.execute("SELECT id FROM functions WHERE file_id = ? AND name = ?", (file_id, name))
-            existing_func = db_cursor.fetchone()
-            if existing_func:
-                # Update the function record
-                db_cursor.execute("UPDATE functions SET return_type=?, parameters=?, is_declaration=?, location=? WHERE id=?",
-                                (return_type, params, is_declaration, location, existing_func[0]))
-            else:
-                # Insert new function
-                db_cursor.execute("INSERT INTO functions (file_id, name, return_type, parameters, is_declaration, location) VALUES (?, ?, ?, ?, ?, ?)",
-                                (file_id, name, return_type, params, is_declaration, location))
-
-    elif cursor.kind == CursorKind.STRUCT_DECL:
-        name = cursor.spelling or None # May be anonymous struct
-        kind = 'struct'
-        members = get_struct_union_members(cursor) or ""
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Ensure it's a definition (not just declaration)
-        if cursor.is_definition():
-            # Check for existing struct
-            db_cursor.execute("SELECT id FROM structs_unions WHERE file_id = ? AND name = ? AND kind = ?",
-                              (file_id, name, kind))
-            existing_struct = db_cursor.fetchone()
-            if existing_struct:
-                # Update the struct record
-                db_cursor.execute("UPDATE structs_unions SET members=?, location=? WHERE id=?",
-                                  (members, location, existing_struct[0]))
-            else:
-                # Insert new struct
-                db_cursor.execute("INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
-                                  (file_id, kind, name, members, location))
-
-    elif cursor.kind == CursorKind.UNION_DECL:
-        name = cursor.spelling or None # May be anonymous union
-        kind = 'union'
-        members = get_struct_union_members(cursor) or ""
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Ensure it's a definition (not just declaration)
-        if cursor.is_definition():
-            # Check for existing union
-            db_cursor.execute("SELECT id FROM structs_unions WHERE file_id = ? AND name = ? AND kind = ?",
-                              (file_id, name, kind))
-            existing_union = db_cursor.fetchone()
-            if existing_union:
-                # Update the union record
-                db_cursor.execute("UPDATE structs_unions SET members=?, location=? WHERE id=?",
-                                  (members, location, existing_union[0]))
-            else:
-                # Insert new union
-                db_cursor.execute("INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
-                                  (file_id, name, kind, members, location))
-
-    elif cursor.kind == CursorKind.ENUM_DECL:
-        name = cursor.spelling or None # May be anonymous enum
-        constants = get_enum_constants(cursor) or ""
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Ensure it's a definition (not just declaration)
-        if cursor.is_definition():
-            # Check for existing enum
-            db_cursor.execute("SELECT id FROM enums WHERE file_id = ? AND name = ?", (file_id, name))
-            existing_enum = db_cursor.fetchone()
-            if existing_enum:
-                # Update the enum record
-                db_cursor.execute("UPDATE enums SET constants=?, location=? WHERE id=?",
-                                  (constants, location, existing_enum[0]))
-            else:
-                # Insert new enum
-                db_cursor.execute("INSERT INTO enums (file_id, name, constants, location) VALUES (?, ?, ?, ?)",
-                                  (file_id, name, constants, location))
-
-    elif cursor.kind == CursorKind.TYPEDEF_DECL:
-        name = cursor.spelling or None
-        underlying_type = cursor.underlying_typedef_type.spelling or ""
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-        # Check for existing typedef
-        db_cursor.execute("SELECT id FROM typedefs WHERE file_id = ? AND name = ?", (file_id, name))
-        existing_TYPEDEF = db_cursor.fetchone()
-        if existing_TYPEDEF:
-            # Update the typedef record
-            db_cursor.execute("UPDATE typedefs SET underlying_type=?, location=? WHERE id=?",
-                              (underlying_type, location, existing_TYPEDEF[0]))
-        else:
-            # Insert new typedef
-            db_cursor.execute("INSERT INTO typedefs (file_id, name, underlying_type, location) VALUES (?, ?, ?, ?)",
-                              (file_id, name, underlying_type, location))
-
-    elif cursor.kind == CursorKind.VAR_DECL:
-        # Only handle file-scope variables (global variables and static variables)
-        # Local variables in functions have cursor.semantic_parent.kind as FUNCTION_DECL
-        if cursor.semantic_parent.kind == CursorKind.TRANSLATION_UNIT:
-            name = cursor.spelling or None
-            var_type = cursor.type.spelling or ""
-            is_extern = 1 if cursor.storage_class == StorageClass.EXTERN else 0
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}" if cursor.location else "unknown"
-
-            # Check for existing variable
-            db_cursor.execute("SELECT id FROM variables WHERE file_id = ? AND name = ?", (file_id, name))
-            existing_var = db_cursor.fetchone()
-            if existing_var:
-                # Update the variable record
-                db_cursor.execute("UPDATE variables SET type=?, is_extern=?, location=? WHERE id=?",
-                                  (var_type, is_extern, location, existing_var[0]))
-            else:
-                # Insert new variable
-                db_cursor.execute("INSERT INTO variables (file_id, name, type, is_extern, location) VALUES (?, ?, ?, ?, ?)",
-                                  (file_id, name, var_type, is_extern, location))
-
-    # --- Recursively explore child nodes ---
-    for child in cursor.get_children():
-        traverse_ast(child, db_conn, file_id, target_filepath)
+    """Walk the AST and collect definitions into rows
+
+    rows maps each table to {key: row tuple}, where key is the name (plus kind
+    for structs_unions). A later definition with the same key replaces the
+    earlier row in place, matching the former SELECT-then-UPDATE behavior.
+    No database access happens here, so this can run in a worker process.
+    Type spellings such as "int" repeat across many rows, so they are interned:
+    equal strings then share one object, which pickle sends back only once.
+    Only cursors in target_filepath (the main file of cursor's translation
+    unit) are recorded, so the basename used in locations is computed once
+    per call instead of per cursor.
+    The tree is walked by libclang itself (clang_visitChildren with
+    CXChildVisit_Recurse), so only one Python callback runs per cursor and
+    deep ASTs cannot hit the recursion limit. Cursors outside the target file
+    and function contents are pruned on the C side by returning
+    CXChildVisit_Continue. Struct/union members are walked from the child
+    list the handler already read, so libclang does not visit them again.
+    """
+    file_basename = os.path.basename(target_filepath)
+    # The target file is the translation unit's main file, so libclang can answer the
+    # file check itself (no File object, CXFile lookup or path comparison per cursor).
+    is_from_main_file = main_file_check()
+    # Dispatch on the raw kind id stored in the Cursor struct (Cursor.kind calls CursorKind.from_id)
+    handlers = {kind.value: handler for kind, handler in DEFINITION_HANDLERS.items()}
+    children_read_kinds = CHILDREN_READ_KINDS
+    record_kinds = RECORD_KINDS
+    leaf_kinds = LEAF_KINDS
+    visit_children = conf.lib.clang_visitChildren
+    tu = cursor._tu
+    errors = []
+
+    def visit(child):
+        # Check if the cursor is in the target file (exclude included headers)
+        # Predefined and -D macros have no file, so they are excluded too
+        if not is_from_main_file(child.location):
+            return CHILD_VISIT_CONTINUE # This cursor is not in target file
+        # Debugging: Display current cursor type and name
+        # print(f"Visiting: {child.kind} - {child.spelling} at {child.location}")
+
+        kind_id = child._kind_id
+        # --- Process various definitions ---
+        handler = handlers.get(kind_id)
+        if handler:
+            # Only members/constants are read from the children; other handlers get ()
+            children = list(child.get_children()) if kind_id in children_read_kinds else ()
+            handler(child, file_id, file_basename, rows, children)
+            if kind_id in record_kinds:
+                # Walk the members from the list already built instead of letting
+                # libclang visit them (and create their cursors) a second time
+                for member in children:
+                    if visit(member) == CHILD_VISIT_RECURSE:
+                        visit_children(member, visitor_callback, None)
+                    if errors:
+                        return CHILD_VISIT_BREAK
+                return CHILD_VISIT_CONTINUE
+        # --- Explore child nodes (only where definitions can be nested) ---
+        return CHILD_VISIT_CONTINUE if kind_id in leaf_kinds else CHILD_VISIT_RECURSE
+
+    def visitor(child, parent, client_data):
+        try:
+            child._tu = tu # Keep the TU alive as long as the cursor (as Cursor.get_children does)
+            return visit(child)
+        except BaseException as e:
+            # An exception cannot cross the C frames; stop the walk and re-raise it below
+            errors.append(e)
+            return CHILD_VISIT_BREAK
+
+    visitor_callback = callbacks['cursor_visit'](visitor)
+    visit_children(cursor, visitor_callback, None)
+    if errors:
+        raise errors[0]
+
+def insert_definitions(conn, rows, cursor=None):
+    """traverse_ast が収集した行をテーブルごとに executemany で挿入する"""
+    if cursor is None:
+        cursor = conn.cursor()
+    for table, table_rows in rows.items():
+        if table_rows:
+            cursor.executemany(INSERT_DEFINITION_SQL[table], table_rows.values())
+
+@contextlib.contextmanager
+def background_writer(conn, cursor=None, max_pending=16):
+    """insert_definitions を別スレッドで実行する書き込み関数を返すコンテキストマネージャ
+
+    返す関数にファイルごとの行を渡すとキューに積まれ、書き込みスレッドが順に挿入する。
+    その間に呼び出し側は次のファイルのパース/走査を進められる (libclangの呼び出し中はGILが解放される)。
+    キューは max_pending 件までで、書き込みが追いつかない場合は呼び出し側が待つ。
+    書き込みスレッドの例外は終了時に呼び出し側で送出する。コミットは呼び出し側で行う。
+    conn は check_same_thread=False で開いておくこと (connect はそうしている)。
+    """
+    if cursor is None:
+        cursor = conn.cursor()
+    pending = queue.Queue(maxsize=max_pending)
+    errors = []
+
+    def run():
+        while True:
+            rows = pending.get()
+            if rows is None: # 終了の合図
+                break
+            if errors:
+                continue # エラー後は残りを読み捨て、呼び出し側が put で止まらないようにする
+            try:
+                insert_definitions(conn, rows, cursor)
+            except BaseException as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=run, name="definition-writer", daemon=True)
+    writer.start()
+    try:
+        yield pending.put
+    finally:
+        pending.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
 
 
 # --- メイン処理 ---
-def main():
-    parser = argparse.ArgumentParser(description='Parse C/C++ header file and store definitions in SQLite.')
-    parser.add_argument('header_file', help='Path to the C/C++ header file to parse.')
-    parser.add_argument('-db', '--database', default='definitions.db', help='Path to the SQLite database file (default: definitions.db).')
-    parser.add_argument('-I', '--include', action='append', default=[], help='Add directory to include search path.')
-    parser.add_argument('-D', '--define', action='append', default=[], help='Define a macro (e.g., -DDEBUG=1).')
-    parser.add_argument('--libclang', help=f'Path to libclang library file (e.g., {LIBCLANG_PATH or "/path/to/libclang.so"})')
-    parser.add_argument('--lang', choices=['c', 'c++'], default=None, help='Force language standard (e.g., c++11). Tries to guess from extension if not provided.')
-    parser.add_argument('--std', default=None, help='Set C/C++ standard (e.g., c11, c++14).')
-
 
-    args = parser.parse_args()
-
-    header_filepath = args.header_file
-    db_filepath = args.database
-    clang_args = []
-
-    # インクルードパスを追加
-    for include_dir in args.include:
-        clang_args.append(f'-I{include_dir}')
-
-    # マクロ定義を追加
-    for define_macro in args.define:
-        clang_args.append(f'-D{define_macro}')
+def configure_libclang(libclang_path):
+    """libclangのライブラリファイルを設定する (ワーカープロセスの初期化にも使う)"""
+    if libclang_path and os.path.exists(libclang_path) and not Config.loaded:
+        Config.set_library_file(libclang_path)
+
+def expand_input_paths(paths):
+    """ディレクトリやワイルドカードを含む指定を、解析対象ファイルのリストに展開する
+
+    ディレクトリは再帰的に探索し、INPUT_EXTENSIONS に一致するファイルをパス順に追加する。
+    ワイルドカードはシェルが展開しない環境 (Windowsなど) 向けに glob で展開する。
+    返すパスは絶対パスで、重複を除き最初に現れた順に並ぶ。
+    """
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                filepaths.extend(
+                    os.path.join(dirpath, filename) for filename in sorted(filenames)
+                    if filename.endswith(INPUT_EXTENSIONS)
+                )
+        elif glob.has_magic(path):
+            filepaths.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            filepaths.append(path)
+    # ディレクトリ・ワイルドカード・直接指定が同じファイルを指すことがあるので、絶対パスにして最初の1つだけ残す
+    return list(dict.fromkeys(cached_abspath(filepath) for filepath in filepaths))
+
+def build_clang_args(args, header_filepath):
+    """コマンドライン引数とファイルの拡張子からClangに渡す引数を組み立てる"""
+    # インクルードパスとマクロ定義を追加
+    # 警告は表示しないので -w で抑止し、Clang側での警告の生成を省く
+    clang_args = [f'-I{include_dir}' for include_dir in args.include]
+    clang_args += [f'-D{define_macro}' for define_macro in args.define]
+    clang_args.append('-w')
 
     # 言語と標準を設定
     language = args.lang
@@ -408,16 +670,118 @@ def main():
         if args.std:
             clang_args.append(f'-std={args.std}')
 
+    return clang_args
+
+@functools.lru_cache(maxsize=None)
+def shared_index():
+    """プロセスごとに1つだけ Index を作り、以降のパースで使い回す
+
+    Index はプロセス間で共有できないので、ワーカープロセスではそれぞれ最初の呼び出しで作られる。
+    """
+    return Index.create()
+
+def ast_cache_path(ast_cache_dir, filepath, clang_args, parse_options=0):
+    """キャッシュするASTファイルのパスを返す (同じファイルでもClang引数やパースオプションが違えば別のキャッシュにする)"""
+    key = "\0".join([os.path.abspath(filepath), str(parse_options), *clang_args])
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(ast_cache_dir, f"{os.path.basename(filepath)}.{digest}.ast")
+
+def load_or_parse_tu(index, filepath, clang_args, parse_options, ast_cache_dir=None):
+    """ASTキャッシュが対象ファイルより新しければ読み込み、なければパースしてキャッシュに保存する
+
+    鮮度は対象ファイル自身の更新日時だけで判定する (インクルード先の変更は検出しない)。
+    """
+    if not ast_cache_dir:
+        return index.parse(filepath, args=clang_args, options=parse_options)
+
+    cache_path = ast_cache_path(ast_cache_dir, filepath, clang_args, parse_options)
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(filepath):
+            return TranslationUnit.from_ast_file(cache_path, index)
+    except (OSError, TranslationUnitLoadError):
+        pass # キャッシュがない、または読み込めない場合はパースし直す
+
+    tu = index.parse(filepath, args=clang_args, options=parse_options)
+    try:
+        os.makedirs(ast_cache_dir, exist_ok=True)
+        tu.save(cache_path)
+    except (OSError, TranslationUnitSaveError) as e:
+        print(f"Warning: Could not save AST cache {cache_path}: {e}", file=sys.stderr)
+    return tu
+
+def parse_one(header_filepath, file_id, clang_args, ast_cache_dir=None, collect_macros=True):
+    """1つのヘッダファイルをパースし、DBに挿入する行をテーブルごとに返す
+
+    DB接続は使わないため、ワーカープロセスからも呼び出せる。
+    collect_macros が偽ならマクロを集めない (詳細な前処理記録なしでパースする)。
+    """
+    # Clangインデックス (プロセス内の全ファイルで共有する)
+    index = shared_index()
+
+    # ヘッダファイルをパース
+    # TU_SKIP_FUNCTION_BODIES: 関数の本体をスキップ（ヘッダ解析では不要なことが多い）
+    # TU_DETAILED_PREPROCESSING_RECORD: マクロ定義などをより詳細に取得 (これがないとマクロのカーソルが作られない)
+    # --no-macros 指定時は記録を作らない (マクロは集めないが、パースは速く、TUも小さくなる)
+    parse_options = TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+    if collect_macros:
+        parse_options |= TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+    # --ast-cache 指定時は、変更のないファイルをパースせずキャッシュから読み込む
+    tu = load_or_parse_tu(index, header_filepath, clang_args, parse_options, ast_cache_dir)
+
+    # パースエラーチェック
+    has_errors = False
+    for diag in tu.diagnostics:
+        # エラーレベルが Error または Fatal の場合
+        if diag.severity >= diag.Error:
+            print(f"Parse Error: {diag.spelling} at {diag.location}", file=sys.stderr)
+            has_errors = True
+
+    # エラーがある場合でも処理を続行するかどうか。ここでは警告して続行する。
+    # if has_errors:
+    #     print("Errors occurred during parsing. Exiting.", file=sys.stderr)
+    #     sys.exit(1)
+
+    # ASTを走査して定義を収集
+    rows = new_definition_rows()
+    traverse_ast(tu.cursor, file_id, os.path.abspath(header_filepath), rows)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse C/C++ header file and store definitions in SQLite.')
+    parser.add_argument('header_files', nargs='+', metavar='header_file', help='Path to the C/C++ header file to parse (multiple files, directories and glob patterns allowed).')
+    parser.add_argument('-db', '--database', default='definitions.db', help='Path to the SQLite database file (default: definitions.db).')
+    parser.add_argument('-I', '--include', action='append', default=[], help='Add directory to include search path.')
+    parser.add_argument('-D', '--define', action='append', default=[], help='Define a macro (e.g., -DDEBUG=1).')
+    parser.add_argument('--libclang', help=f'Path to libclang library file (e.g., {LIBCLANG_PATH or "/path/to/libclang.so"})')
+    parser.add_argument('--lang', choices=['c', 'c++'], default=None, help='Force language standard (e.g., c++11). Tries to guess from extension if not provided.')
+    parser.add_argument('--std', default=None, help='Set C/C++ standard (e.g., c11, c++14).')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of worker processes used when parsing multiple files (default: number of CPUs).')
+    parser.add_argument('--ast-cache', metavar='DIR', default=None, help='Directory for cached ASTs; unchanged files are loaded from the cache instead of being reparsed.')
+    parser.add_argument('--skip-unchanged', action='store_true', help='Skip files whose content and parse settings (clang arguments, --no-macros) match the previous --skip-unchanged run.')
+    parser.add_argument('--no-macros', action='store_true', help='Do not collect macros. Parsing without the detailed preprocessing record is faster and uses less memory.')
+
 
-    print(f"Parsing: {header_filepath}")
+    args = parser.parse_args()
+
+    header_filepaths = expand_input_paths(args.header_files)
+    if not header_filepaths:
+        print("Error: No input files found.", file=sys.stderr)
+        sys.exit(1)
+    db_filepath = args.database
+    jobs = []
+
+    for header_filepath in header_filepaths:
+        clang_args = build_clang_args(args, header_filepath)
+        jobs.append((header_filepath, clang_args))
+        print(f"Parsing: {header_filepath}")
+        print(f"Clang Args: {' '.join(clang_args)}")
     print(f"Database: {db_filepath}")
-    print(f"Clang Args: {' '.join(clang_args)}")
 
     # libclangのパス設定
     libclang_path_to_use = args.libclang or LIBCLANG_PATH
     if libclang_path_to_use:
         if os.path.exists(libclang_path_to_use):
-            Config.set_library_file(libclang_path_to_use)
+            configure_libclang(libclang_path_to_use)
             print(f"Using libclang: {libclang_path_to_use}")
         else:
             print(f"Warning: Specified libclang path not found: {libclang_path_to_use}", file=sys.stderr)
@@ -427,49 +791,76 @@ def main():
          print("Attempting to find libclang automatically...")
 
 
+    header_filepath = None
     try:
-        # Clangインデックスを作成
-        index = Index.create()
-
-        # ヘッダファイルをパース
-        # TU_SKIP_FUNCTION_BODIES: 関数の本体をスキップ（ヘッダ解析では不要なことが多い）
-        # TU_DETAILED_PREPROCESSING_RECORD: マクロ定義などをより詳細に取得
-        parse_options = (
-            TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
-        )
-        tu = index.parse(
-            header_filepath,
-            args=clang_args,
-            options=parse_options
-        )
-
-        # パースエラーチェック
-        has_errors = False
-        for diag in tu.diagnostics:
-            # エラーレベルが Error または Fatal の場合
-            if diag.severity >= diag.Error:
-                print(f"Parse Error: {diag.spelling} at {diag.location}", file=sys.stderr)
-                has_errors = True
-        
-        # エラーがある場合でも処理を続行するかどうか。ここでは警告して続行する。
-        # if has_errors:
-        #     print("Errors occurred during parsing. Exiting.", file=sys.stderr)
-        #     sys.exit(1)
-
         # データベース接続とセットアップ
-        conn = setup_database(db_filepath)
-
-        # ファイルレコードを追加/更新し、ファイルIDを取得
-        target_filepath_abs = os.path.abspath(header_filepath)
-        file_id = add_file_record(conn, header_filepath)
-
-        # ASTを走査して定義をDBに追加
-        print("Traversing AST and storing definitions...")
-        traverse_ast(tu.cursor, conn, file_id, target_filepath_abs)
+        # DBファイルがまだなければメモリ上に作り、最後に一度だけディスクに書き出す (行ごとのページ書き込みを避ける)
+        build_in_memory = db_filepath != ':memory:' and not os.path.exists(db_filepath)
+        conn = setup_database(':memory:' if build_in_memory else db_filepath)
+        # 1回の実行で使うカーソルは1つだけ作って各ヘルパーで使い回す
+        db_cursor = conn.cursor()
+
+        # 各ファイルの内容と解析設定のハッシュ (files.content_hash に保存し、--skip-unchanged の判定に使う)
+        # ファイル全体を読むので、--skip-unchanged のときだけ計算する (それ以外では content_hash は NULL になり、次回は必ず解析される)
+        content_hashes = {}
+        if args.skip_unchanged:
+            for header_filepath, clang_args in jobs:
+                parse_settings = [*clang_args, f"collect_macros={not args.no_macros}"]
+                content_hashes[cached_abspath(header_filepath)] = file_content_hash(header_filepath, parse_settings)
+            stored_hashes = get_stored_content_hashes(conn, header_filepaths, db_cursor)
+            unchanged = {filepath for filepath, content_hash in content_hashes.items()
+                         if stored_hashes.get(filepath) == content_hash}
+            for filepath in sorted(unchanged):
+                print(f"Unchanged, skipping: {filepath}")
+            jobs = [job for job in jobs if cached_abspath(job[0]) not in unchanged]
+            header_filepaths = [header_filepath for header_filepath, _ in jobs]
+            if not jobs:
+                print("All files are unchanged. Nothing to do.")
+                conn.close()
+                return
+
+        # ファイル登録から定義の挿入までを1トランザクションで行う (成功時にコミット、例外時はロールバック)
+        with conn:
+            # ファイルが1つも登録されていなければ、空のDBへの最初の一括登録
+            initial_load = not db_cursor.execute("SELECT EXISTS (SELECT 1 FROM files)").fetchone()[0]
+            # ファイルレコードを一括で追加/更新し、ファイルIDを取得
+            file_ids = add_file_records(conn, header_filepaths, db_cursor, content_hashes)
+
+            # ASTを走査して定義をDBに追加
+            # パースは各ファイル独立なのでワーカープロセスで並列に行い、DBへの書き込みはこのプロセスだけが行う
+            print("Traversing AST and storing definitions...")
+            # 空のDBに複数ファイルを登録する場合は検索用インデックスを外して挿入し、最後に一度だけ作り直す
+            # 既存のDBの一部を更新する場合は、全行からのインデックス再作成の方が高くつくので外さない
+            if initial_load and len(jobs) > 1:
+                index_guard = suspended_indexes(conn, BULK_LOAD_SUSPENDED_INDEXES)
+            else:
+                index_guard = contextlib.nullcontext()
+            # 挿入は書き込みスレッドで行い、次のファイルのパースと重ねる
+            with index_guard, background_writer(conn, db_cursor) as write_definitions:
+                if len(jobs) == 1 or args.jobs <= 1:
+                    for (header_filepath, clang_args), file_id in zip(jobs, file_ids):
+                        write_definitions(parse_one(header_filepath, file_id, clang_args, args.ast_cache, not args.no_macros))
+                else:
+                    with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs)),
+                                             initializer=configure_libclang,
+                                             initargs=(libclang_path_to_use,)) as executor:
+                        futures = {
+                            executor.submit(parse_one, header_filepath, file_id, clang_args, args.ast_cache, not args.no_macros): header_filepath
+                            for (header_filepath, clang_args), file_id in zip(jobs, file_ids)
+                        }
+                        for future in as_completed(futures):
+                            header_filepath = futures[future]
+                            write_definitions(future.result())
+
+            if initial_load:
+                # 作り直したインデックスの統計情報をクエリプランナー用に集める
+                db_cursor.execute("ANALYZE")
 
-        # データベースへの変更をコミット
-        conn.commit()
         print("Committing changes to database.")
+        # 閉じる前にクエリプランナーの統計を必要な分だけ更新する (メモリ上のDBなら書き出す前に)
+        db_cursor.execute("PRAGMA optimize")
+        if build_in_memory:
+            save_database(conn, db_filepath)
 
         # 接続を閉じる
         conn.close()
@@ -1,258 +1,388 @@
 import sys
+import ctypes
 import os
 import sqlite3
 import argparse
 import time
-from clang.cindex import Index, Config, CursorKind, TypeKind, TranslationUnit, StorageClass
+import json
+import functools
+import contextlib
+import hashlib
+import glob
+import mmap
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from clang.cindex import Index, Config, CursorKind, TypeKind, TranslationUnit, StorageClass, TranslationUnitLoadError, TranslationUnitSaveError, SourceLocation, conf, callbacks
 
 # --- グローバル変数 ---
 # libclangのライブラリファイルのパス (環境に合わせて変更が必要な場合あり)
 LIBCLANG_PATH = None
 # LIBCLANG_PATH = '/path/to/libclang.so' # Linux の例
 # LIBCLANG_PATH = '/path/to/libclang.dylib' # macOS の例
+# ディレクトリが指定された場合に解析対象とする実装ファイルの拡張子
+INPUT_EXTENSIONS = ('.c', '.cpp', '.cxx', '.cc', '.C')
 
 # --- データベース関連 ---
 
+# DBヘルパーはコミットしない (ヘッダ解析と同じ)。呼び出し側が with conn: でトランザクションを区切る。
+
+# 定義を格納するテーブル (files 以外)
+DEFINITION_TABLES = ['macros', 'functions', 'structs_unions', 'enums', 'typedefs', 'variables']
+# 定義削除用のSQL (呼び出し毎に文字列を組み立てず、SQLiteのステートメントキャッシュに乗せる)
+CLEAR_DEFINITIONS_SQL = [
+    f"DELETE FROM {table} WHERE file_id IN (SELECT value FROM json_each(?))"
+    for table in DEFINITION_TABLES
+]
+# traverse_ast が収集した行の挿入SQL (テーブルごとに executemany で使う)
+INSERT_DEFINITION_SQL = {
+    'macros': "INSERT INTO macros (file_id, name, body, location) VALUES (?, ?, ?, ?)",
+    'functions': "INSERT INTO functions (file_id, name, return_type, parameters, is_declaration, is_static, parent_kind, parent_name, location) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    'structs_unions': "INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
+    'enums': "INSERT INTO enums (file_id, name, constants, location) VALUES (?, ?, ?, ?)",
+    'typedefs': "INSERT INTO typedefs (file_id, name, underlying_type, location) VALUES (?, ?, ?, ?)",
+    'variables': "INSERT INTO variables (file_id, name, type, is_extern, is_static, has_initializer, location) VALUES (?, ?, ?, ?, ?, ?, ?)",
+}
+# ファイルの登録/更新を1文で行うUPSERT (パスはJSON配列で渡し、全ファイルのIDを RETURNING で受け取る)
+# INSERT ... SELECT と ON CONFLICT を併用する場合、構文の曖昧さを避けるため WHERE true が必要
+UPSERT_FILES_SQL = """
+    INSERT INTO files (filepath, last_parsed_at, content_hash)
+    SELECT json_extract(value, '$[0]'), ?, json_extract(value, '$[1]') FROM json_each(?) WHERE true
+    ON CONFLICT (filepath) DO UPDATE SET last_parsed_at = excluded.last_parsed_at, content_hash = excluded.content_hash
+    RETURNING id, filepath
+"""
+SELECT_CONTENT_HASHES_SQL = "SELECT filepath, content_hash FROM files WHERE filepath IN (SELECT value FROM json_each(?))"
+# os.path.abspath のメモ化版 (同じパスが何度も現れる場合の getcwd/正規化を省く)
+# 相対パスの結果はカレントディレクトリに依存するため、os.chdir した場合は cached_abspath.cache_clear() を呼ぶこと
+cached_abspath = functools.lru_cache(maxsize=8192)(os.path.abspath)
+# 接続時に設定するPRAGMA
+# WALモードでは読み取り側が解析中の書き込みをブロックせず、コミット毎のfsyncも減る
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MiB
+    "PRAGMA mmap_size=268435456",    # 256 MiB
+    "PRAGMA foreign_keys=ON",
+]
+# 複数ファイルの一括登録中は削除しておき、最後にまとめて作り直す検索用インデックス
+# file_id のインデックスは再解析時の DELETE で使うため残す
+BULK_LOAD_SUSPENDED_INDEXES = ['idx_macro_name', 'idx_func_name', 'idx_func_parent', 'idx_struct_name', 'idx_enum_name', 'idx_typedef_name', 'idx_var_name']
+
+# ヘッダ解析と同じ関数 (変更なし)
+def connect(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# テーブルとインデックスを作成するDDL (executescript で1回のスクリプトとして実行する)
+SCHEMA_SQL = """
+    -- ファイル管理テーブル (ヘッダと同じ)
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filepath TEXT UNIQUE NOT NULL,
+        last_parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        content_hash TEXT -- 前回解析時のファイル内容と解析設定のSHA-256 (--skip-unchanged で使う。それ以外の実行では NULL)
+    );
+
+    -- マクロ定義テーブル (ヘッダと同じ - .c/.cpp内で定義されるマクロ用)
+    CREATE TABLE IF NOT EXISTS macros (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        body TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_macro_name ON macros (name);
+
+    -- 関数定義/宣言テーブル (拡張)
+    CREATE TABLE IF NOT EXISTS functions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        return_type TEXT,
+        parameters TEXT,
+        is_declaration INTEGER NOT NULL, -- 0: 定義(本体あり), 1: 宣言(プロトタイプ)
+        is_static INTEGER DEFAULT 0,     -- 1: static関数, 0: その他
+        parent_kind TEXT,                -- C++用: 親カーソルの種類 (例: CLASS_DECL)
+        parent_name TEXT,                -- C++用: 親クラス/構造体名
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_func_name ON functions (name);
+    CREATE INDEX IF NOT EXISTS idx_func_parent ON functions (parent_name);
+
+    -- 構造体/共用体定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
+    CREATE TABLE IF NOT EXISTS structs_unions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        kind TEXT NOT NULL, -- 'struct' or 'union'
+        name TEXT,
+        members TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_struct_name ON structs_unions (name);
+
+    -- 列挙型定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
+    CREATE TABLE IF NOT EXISTS enums (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT,
+        constants TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_enum_name ON enums (name);
+
+    -- Typedef定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
+    CREATE TABLE IF NOT EXISTS typedefs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        underlying_type TEXT,
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_typedef_name ON typedefs (name);
+
+    -- グローバル/静的変数 定義/宣言テーブル (拡張)
+    CREATE TABLE IF NOT EXISTS variables (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT,
+        is_extern INTEGER DEFAULT 0,     -- 1: extern宣言, 0: その他(定義の可能性)
+        is_static INTEGER DEFAULT 0,     -- 1: static変数, 0: その他
+        has_initializer INTEGER DEFAULT 0, -- 1: 初期化子を持つ, 0: 持たない (簡易チェック)
+        location TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_var_name ON variables (name);
+
+    -- file_id のインデックス (再解析時の DELETE ... WHERE file_id がテーブル全走査にならないように)
+""" + "".join(
+    f"    CREATE INDEX IF NOT EXISTS idx_{table}_file_id ON {table} (file_id);\n"
+    for table in DEFINITION_TABLES
+)
+
 def setup_database(db_path):
     """SQLiteデータベースをセットアップし、テーブルを作成する"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # ファイル管理テーブル (ヘッダと同じ)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filepath TEXT UNIQUE NOT NULL,
-            last_parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # マクロ定義テーブル (ヘッダと同じ - .c/.cpp内で定義されるマクロ用)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS macros (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            body TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_macro_name ON macros (name)')
-
-    # 関数定義/宣言テーブル (拡張)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS functions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            return_type TEXT,
-            parameters TEXT,
-            is_declaration INTEGER NOT NULL, -- 0: 定義(本体あり), 1: 宣言(プロトタイプ)
-            is_static INTEGER DEFAULT 0,     -- 1: static関数, 0: その他
-            parent_kind TEXT,                -- C++用: 親カーソルの種類 (例: CLASS_DECL)
-            parent_name TEXT,                -- C++用: 親クラス/構造体名
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_func_name ON functions (name)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_func_parent ON functions (parent_name)')
-
-
-    # 構造体/共用体定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS structs_unions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            kind TEXT NOT NULL, -- 'struct' or 'union'
-            name TEXT,
-            members TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_struct_name ON structs_unions (name)')
-
-
-    # 列挙型定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS enums (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT,
-            constants TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_enum_name ON enums (name)')
-
-
-    # Typedef定義テーブル (ヘッダと同じ - .c/.cpp内で定義される場合用)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS typedefs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            underlying_type TEXT,
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_typedef_name ON typedefs (name)')
-
-
-    # グローバル/静的変数 定義/宣言テーブル (拡張)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS variables (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            type TEXT,
-            is_extern INTEGER DEFAULT 0,     -- 1: extern宣言, 0: その他(定義の可能性)
-            is_static INTEGER DEFAULT 0,     -- 1: static変数, 0: その他
-            has_initializer INTEGER DEFAULT 0, -- 1: 初期化子を持つ, 0: 持たない (簡易チェック)
-            location TEXT,
-            FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_var_name ON variables (name)')
-
-
-    conn.commit()
+    conn = connect(db_path)
+    # 全DDLを1トランザクションで実行する
+    conn.executescript(f"BEGIN;\n{SCHEMA_SQL}COMMIT;")
+    # content_hash 列がない以前のバージョンのDBには列を追加する (ヘッダと同じ)
+    if 'content_hash' not in {row[1] for row in conn.execute("PRAGMA table_info(files)")}:
+        with conn:
+            conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
     return conn
 
 # ヘッダ解析と同じ関数 (変更なし)
-def clear_definitions_for_file(conn, file_id):
-    cursor = conn.cursor()
-    # 注意: テーブル名は更新されたスキーマに合わせてください
-    tables = ['macros', 'functions', 'structs_unions', 'enums', 'typedefs', 'variables']
-    for table in tables:
-        cursor.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
-    conn.commit()
+def save_database(conn, db_path):
+    disk_conn = connect(db_path)
+    try:
+        conn.backup(disk_conn)
+    finally:
+        disk_conn.close()
+
+# ヘッダ解析と同じ関数 (変更なし)
+def begin_bulk(conn):
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+# ヘッダ解析と同じ関数 (変更なし)
+@contextlib.contextmanager
+def suspended_indexes(conn, index_names):
+    """with ブロックの間だけインデックスを削除し、抜けるときに元の定義で作り直す"""
+    placeholders = ', '.join('?' * len(index_names))
+    index_sqls = conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND name IN ({placeholders})",
+        index_names).fetchall()
+    for name in index_names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        for (sql,) in index_sqls:
+            conn.execute(sql)
+
+def clear_definitions_for_files(conn, file_ids, cursor=None):
+    if cursor is None:
+        cursor = conn.cursor()
+    # 注意: テーブル名は更新されたスキーマに合わせてください (DEFINITION_TABLES)
+    file_ids_json = json.dumps(list(file_ids))
+    for sql in CLEAR_DEFINITIONS_SQL:
+        cursor.execute(sql, (file_ids_json,))
 
 # ヘッダ解析と同じ関数 (変更なし)
-def add_file_record(conn, filepath):
-    cursor = conn.cursor()
-    filepath_abs = os.path.abspath(filepath)
+def clear_definitions_for_file(conn, file_id, cursor=None):
+    clear_definitions_for_files(conn, [file_id], cursor)
+
+# ヘッダ解析と同じ関数 (変更なし)
+def file_content_hash(filepath, parse_settings=()):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data)
+    for setting in parse_settings:
+        digest.update(b"\0" + setting.encode())
+    return digest.hexdigest()
+
+# ヘッダ解析と同じ関数 (変更なし)
+def get_stored_content_hashes(conn, filepaths, cursor=None):
+    if cursor is None:
+        cursor = conn.cursor()
+    filepaths_abs = [cached_abspath(filepath) for filepath in filepaths]
+    cursor.execute(SELECT_CONTENT_HASHES_SQL, (json.dumps(filepaths_abs),))
+    return dict(cursor.fetchall())
+
+# ヘッダ解析と同じ関数 (変更なし)
+def add_file_records(conn, filepaths, cursor=None, content_hashes=None):
+    if cursor is None:
+        cursor = conn.cursor()
+    filepaths_abs = [cached_abspath(filepath) for filepath in filepaths]
+    unique_filepaths = list(dict.fromkeys(filepaths_abs))
     now = time.strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute("SELECT id FROM files WHERE filepath = ?", (filepath_abs,))
-    result = cursor.fetchone()
-    if result:
-        file_id = result[0]
-        cursor.execute("UPDATE files SET last_parsed_at = ? WHERE id = ?", (now, file_id))
-        print(f"Updating records for file: {filepath_abs} (ID: {file_id})")
-        clear_definitions_for_file(conn, file_id)
-    else:
-        cursor.execute("INSERT INTO files (filepath, last_parsed_at) VALUES (?, ?)", (filepath_abs, now))
-        file_id = cursor.lastrowid
-        print(f"Adding new record for file: {filepath_abs} (ID: {file_id})")
-    conn.commit()
-    return file_id
+
+    begin_bulk(conn)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM files")
+    max_existing_id = cursor.fetchone()[0]
+
+    content_hashes = content_hashes or {}
+    file_entries = [[filepath, content_hashes.get(filepath)] for filepath in unique_filepaths]
+    cursor.execute(UPSERT_FILES_SQL, (now, json.dumps(file_entries)))
+    file_ids = {filepath: file_id for file_id, filepath in cursor.fetchall()}
+    existing_file_ids = {
+        filepath: file_ids[filepath] for filepath in unique_filepaths
+        if file_ids[filepath] <= max_existing_id
+    }
+
+    for filepath, file_id in existing_file_ids.items():
+        print(f"Updating records for file: {filepath} (ID: {file_id})")
+    clear_definitions_for_files(conn, existing_file_ids.values(), cursor)
+
+    for filepath in unique_filepaths:
+        if filepath not in existing_file_ids:
+            print(f"Adding new record for file: {filepath} (ID: {file_ids[filepath]})")
+
+    return [file_ids[filepath] for filepath in filepaths_abs]
+
+# ヘッダ解析と同じ関数 (変更なし)
+def add_file_record(conn, filepath, cursor=None):
+    return add_file_records(conn, [filepath], cursor)[0]
 
 # ヘッダ解析と同じ関数 (変更なし)
 def get_macro_body(cursor):
-    tokens = list(cursor.get_tokens())
-    if len(tokens) > 1:
-        body = ""
-        last_token_end = tokens[0].extent.end.column
-        for i in range(1, len(tokens)):
-            token = tokens[i]
-            space = " " * max(0, token.extent.start.column - last_token_end)
-            body += space + token.spelling
-            last_token_end = token.extent.end.column
-        return body.strip()
-    return None
+    tokens = cursor.get_tokens()
+    first_token = next(tokens, None)
+    if first_token is None:
+        return None
+    parts = []
+    last_token_end = first_token.extent.end.column
+    for token in tokens:
+        extent = token.extent
+        gap = extent.start.column - last_token_end
+        if gap > 0: # 隣接するトークン (例: "(x)") では空文字を追加しない
+            parts.append(" " * gap)
+        parts.append(token.spelling)
+        last_token_end = extent.end.column
+    if not parts:
+        return None
+    return "".join(parts).strip()
 
 # ヘッダ解析と同じ関数 (変更なし)
 def get_function_params(cursor):
-    params = []
     # get_arguments() は宣言に対して有効。定義の場合は型情報を辿る必要がある場合も。
     # libclangがうまく取れない場合、cursor.type.argument_types() なども試せるが複雑化する。
     # ここでは get_arguments() がうまく機能することを期待する。
     try:
-        for arg in cursor.get_arguments():
-             # 引数名がない場合もある (例: void func(int);)
-            param_name = arg.spelling or ""
-            param_type = arg.type.spelling
-            params.append(f"{param_type} {param_name}".strip())
+        # 引数名がない場合もある (例: void func(int);) ので、そのときは型だけにする (strip で末尾の空白を削るより安い)
+        params = [
+            f"{arg.type.spelling} {arg_name}" if (arg_name := arg.spelling) else arg.type.spelling
+            for arg in cursor.get_arguments()
+        ]
     except Exception as e:
         print(f"Warning: Could not get arguments for {cursor.spelling}: {e}", file=sys.stderr)
         # 型情報からパラメータを取得するフォールバック (より複雑)
         try:
-             func_type = cursor.type
-             if func_type.kind == TypeKind.FUNCTIONPROTO or func_type.kind == TypeKind.FUNCTIONNOPROTO:
-                 arg_types = func_type.argument_types()
-                 for i, arg_type in enumerate(arg_types):
-                     params.append(f"{arg_type.spelling} arg{i+1}") # 仮の引数名
+            func_type = cursor.type
+            params = []
+            if func_type.kind == TypeKind.FUNCTIONPROTO or func_type.kind == TypeKind.FUNCTIONNOPROTO:
+                params = [f"{arg_type.spelling} arg{i+1}" for i, arg_type in enumerate(func_type.argument_types())] # 仮の引数名
         except Exception as e2:
-             print(f"Warning: Could not get argument types for {cursor.spelling}: {e2}", file=sys.stderr)
-             return "..." # 取得失敗を示す
+            print(f"Warning: Could not get argument types for {cursor.spelling}: {e2}", file=sys.stderr)
+            return "..." # 取得失敗を示す
 
     return ", ".join(params)
 
 
 # ヘッダ解析と同じ関数 (変更なし)
-def get_struct_union_members(cursor):
-    members = []
-    for child in cursor.get_children():
-        if child.kind == CursorKind.FIELD_DECL:
-            members.append(f"{child.type.spelling} {child.spelling};")
-    return " ".join(members)
+def get_struct_union_members(cursor, children=None):
+    field_decl = CursorKind.FIELD_DECL.value
+    return " ".join(
+        f"{child.type.spelling} {child.spelling};"
+        for child in (cursor.get_children() if children is None else children) if child._kind_id == field_decl
+    )
 
 # ヘッダ解析と同じ関数 (変更なし)
-def get_enum_constants(cursor):
-    constants = []
-    for child in cursor.get_children():
-        if child.kind == CursorKind.ENUM_CONSTANT_DECL:
-            const_name = child.spelling
-            const_val = child.enum_value
-            constants.append(f"{const_name}={const_val}")
-    return ", ".join(constants)
-
-def has_initializer(cursor):
-    """変数が初期化子を持つか簡易的にチェック"""
+def get_enum_constants(cursor, children=None):
+    enum_constant_decl = CursorKind.ENUM_CONSTANT_DECL.value
+    return ", ".join(
+        f"{child.spelling}={child.enum_value}"
+        for child in (cursor.get_children() if children is None else children) if child._kind_id == enum_constant_decl
+    )
+
+# 初期化式とみなすカーソルの種類 (網羅的ではない可能性あり)
+# 呼び出し毎にリストを作らないようモジュール読み込み時に1回だけ frozenset にしておく
+# 子カーソルの生の種類ID (cursor._kind_id) と比べるので値で持つ (Cursor.kind は CursorKind.from_id を呼ぶ)
+INITIALIZER_KINDS = frozenset(kind.value for kind in (
+    CursorKind.INTEGER_LITERAL, CursorKind.FLOATING_LITERAL,
+    CursorKind.IMAGINARY_LITERAL, CursorKind.STRING_LITERAL,
+    CursorKind.CHARACTER_LITERAL, CursorKind.CXX_BOOL_LITERAL_EXPR,
+    CursorKind.CXX_NULL_PTR_LITERAL_EXPR, CursorKind.GNU_NULL_EXPR,
+    CursorKind.UNEXPOSED_EXPR, # 初期化式が複雑な場合これになることも
+    CursorKind.CALL_EXPR, CursorKind.INIT_LIST_EXPR,
+    CursorKind.PAREN_EXPR, CursorKind.UNARY_OPERATOR,
+    CursorKind.BINARY_OPERATOR,
+    CursorKind.CONDITIONAL_OPERATOR, CursorKind.CSTYLE_CAST_EXPR,
+    CursorKind.CXX_STATIC_CAST_EXPR, CursorKind.CXX_DYNAMIC_CAST_EXPR,
+    CursorKind.CXX_REINTERPRET_CAST_EXPR, CursorKind.CXX_CONST_CAST_EXPR,
+    CursorKind.CXX_FUNCTIONAL_CAST_EXPR, CursorKind.CXX_NEW_EXPR,
+    CursorKind.CXX_DELETE_EXPR, CursorKind.CXX_THIS_EXPR,
+    CursorKind.ADDR_LABEL_EXPR, CursorKind.StmtExpr, # GCC拡張
+    CursorKind.COMPOUND_LITERAL_EXPR # C99複合リテラル
+))
+
+def has_initializer(cursor, children=None):
+    """変数が初期化子を持つか簡易的にチェック (children は取得済みの子カーソル)"""
     # VAR_DECL の子は型(TYPE_REFなど)と初期化式(INTEGER_LITERAL, CALL_EXPRなど)になる
-    for child in cursor.get_children():
-        # 代表的な初期化式の種類をチェック (網羅的ではない可能性あり)
-        if child.kind in [
-            CursorKind.INTEGER_LITERAL, CursorKind.FLOATING_LITERAL,
-            CursorKind.IMAGINARY_LITERAL, CursorKind.STRING_LITERAL,
-            CursorKind.CHARACTER_LITERAL, CursorKind.CXX_BOOL_LITERAL_EXPR,
-            CursorKind.CXX_NULL_PTR_LITERAL_EXPR, CursorKind.GNU_NULL_EXPR,
-            CursorKind.UNEXPOSED_EXPR, # 初期化式が複雑な場合これになることも
-            CursorKind.CALL_EXPR, CursorKind.INIT_LIST_EXPR,
-            CursorKind.PAREN_EXPR, CursorKind.UNARY_OPERATOR,
-            CursorKind.BINARY_OPERATOR,
-            CursorKind.CONDITIONAL_OPERATOR, CursorKind.CSTYLE_CAST_EXPR,
-            CursorKind.CXX_STATIC_CAST_EXPR, CursorKind.CXX_DYNAMIC_CAST_EXPR,
-            CursorKind.CXX_REINTERPRET_CAST_EXPR, CursorKind.CXX_CONST_CAST_EXPR,
-            CursorKind.CXX_FUNCTIONAL_CAST_EXPR, CursorKind.CXX_NEW_EXPR,
-            CursorKind.CXX_DELETE_EXPR, CursorKind.CXX_THIS_EXPR,
-            CursorKind.ADDR_LABEL_EXPR, CursorKind.StmtExpr, # GCC拡張
-            CursorKind.COMPOUND_LITERAL_EXPR # C99複合リテラル
-        ]:
-            return 1
-    return 0
+    # 最初に見つかった初期化式で打ち切る
+    if children is None:
+        children = cursor.get_children()
+    return int(any(child._kind_id in INITIALIZER_KINDS for child in children))
 
 
 # --- Clang AST Analysis (updated for implementation files) ---
 
-def traverse_ast(cursor, db_conn, file_id, target_filepath):
-    """Recursively traverse the AST and add definitions to the database"""
-    db_cursor = db_conn.cursor()
+def new_definition_rows():
+    """traverse_ast が収集する行の入れ物を作る (テーブル名 -> 行タプルのリスト)"""
+    return {table: [] for table in DEFINITION_TABLES}
 
-    # Determine if the cursor is in the target file or a related header
-    in_target_file = False
-    if cursor.location and cursor.location.file:
-        try:
-            in_target_file = os.path.abspath(cursor.location.file.name) == target_filepath
-        except FileNotFoundError:
-            # Can error out for temporary files, etc.
-            pass
-    
-    # Get scope (file scope, class/struct scope, etc.)
+# Semantic parents that make a declaration class/namespace scoped
+CLASS_SCOPE_KINDS = frozenset([CursorKind.CLASS_DECL, CursorKind.STRUCT_DECL, CursorKind.NAMESPACE])
+
+# Value stored in structs_unions.kind for each raw cursor kind id (looked up via cursor._kind_id)
+STRUCT_UNION_KIND_NAMES = {CursorKind.STRUCT_DECL.value: 'struct', CursorKind.UNION_DECL.value: 'union'}
+
+def get_cursor_scope(cursor):
+    """Return (parent_kind, parent_name, is_file_scope, is_class_scope) for a cursor
+
+    Only called by the collect_* handlers, so the semantic parent is looked up
+    for recorded kinds only instead of for every node.
+    """
     parent_kind = None
     parent_name = None
     is_file_scope = False
@@ -264,151 +394,296 @@ def traverse_ast(cursor, db_conn, file_id, target_filepath):
             parent_kind_enum = semantic_parent.kind
             parent_kind = parent_kind_enum.name # Store as string
             is_file_scope = parent_kind_enum == CursorKind.TRANSLATION_UNIT
-            is_class_scope = parent_kind_enum in [CursorKind.CLASS_DECL, CursorKind.STRUCT_DECL, CursorKind.NAMESPACE] # C++
+            is_class_scope = parent_kind_enum in CLASS_SCOPE_KINDS # C++
             if is_class_scope and semantic_parent.spelling:
                  parent_name = semantic_parent.spelling
     except Exception as e:
         # print(f"Debug: Could not get semantic parent for {cursor.kind} {cursor.spelling}: {e}", file=sys.stderr)
         pass # Sometimes parent can't be retrieved
+    return parent_kind, parent_name, is_file_scope, is_class_scope
+
+# Macro (defined in the file)
+def collect_macro(cursor, file_id, file_basename, rows, children):
+    name = cursor.spelling
+    body = get_macro_body(cursor)
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+    if name:
+        rows['macros'].append((file_id, name, body, location))
+
+# Function (file scope or class scope)
+def collect_function(cursor, file_id, file_basename, rows, children):
+    # In .cpp files, functions may be declared in headers and defined in .cpp files, appearing in both.
+    # traverse_ast only dispatches cursors in the current file.
+    parent_kind, parent_name, is_file_scope, is_class_scope = get_cursor_scope(cursor)
+    if not (is_file_scope or is_class_scope):
+        return
+    name = cursor.spelling
+    if not name: # Skip unnamed functions
+        return
+
+    return_type = sys.intern(cursor.result_type.spelling)
+    params = get_function_params(cursor)
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+    is_definition = cursor.is_definition() # Has body (is a definition)
+    storage_class = cursor.storage_class
+    is_static = storage_class == StorageClass.STATIC
+
+    # C++ constructors/destructors may not have a return type
+    if not return_type and parent_kind in ['CLASS_DECL', 'STRUCT_DECL']:
+         if name == parent_name: # Constructor
+             return_type = "(constructor)"
+         elif name == f"~{parent_name}": # Destructor
+             return_type = "(destructor)"
+
+    # print(f" Found Function: {name} (static={is_static}, def={is_definition}) in {parent_kind}:{parent_name} at {location}")
+    rows['functions'].append(
+        (file_id, name, return_type, params, 0 if is_definition else 1, 1 if is_static else 0, parent_kind if is_class_scope else None, parent_name if is_class_scope else None, location)
+    )
+
+# Global variables / file static variables (file scope only)
+def collect_variable(cursor, file_id, file_basename, rows, children):
+    if not get_cursor_scope(cursor)[2]: # is_file_scope
+        return
+    name = cursor.spelling
+    if not name: # Skip unnamed variables
+        return
+
+    var_type = sys.intern(cursor.type.spelling)
+    storage_class = cursor.storage_class
+    is_extern = storage_class == StorageClass.EXTERN
+    is_static = storage_class == StorageClass.STATIC
+    init = has_initializer(cursor, children)
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+
+    # print(f" Found Variable: {name} (static={is_static}, extern={is_extern}, init={init}) at {location}")
+    rows['variables'].append(
+        (file_id, name, var_type, 1 if is_extern else 0, 1 if is_static else 0, init, location)
+    )
+
+# Structs/unions (file scope) - usually defined in headers, but also possible in .c/.cpp files
+def collect_struct_union(cursor, file_id, file_basename, rows, children):
+    if not cursor.is_definition() or not get_cursor_scope(cursor)[2]: # Record only file scope definitions
+        return
+    name = cursor.spelling or None
+    kind = STRUCT_UNION_KIND_NAMES[cursor._kind_id]
+    members = get_struct_union_members(cursor, children)
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+    rows['structs_unions'].append((file_id, kind, name, members, location))
+
+# Enums (file scope)
+def collect_enum(cursor, file_id, file_basename, rows, children):
+    if not cursor.is_definition() or not get_cursor_scope(cursor)[2]:
+        return
+    name = cursor.spelling or None
+    constants = get_enum_constants(cursor, children)
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+    rows['enums'].append((file_id, name, constants, location))
+
+# Typedefs (file scope)
+def collect_typedef(cursor, file_id, file_basename, rows, children):
+    if not get_cursor_scope(cursor)[2]:
+        return
+    name = cursor.spelling
+    try:
+         underlying_type = sys.intern(cursor.underlying_typedef_type.spelling)
+    except Exception:
+         underlying_type = "unknown" # Handle cases where underlying type can't be retrieved
+    loc = cursor.location
+    location = f"{file_basename}:{loc.line}:{loc.column}"
+    rows['typedefs'].append((file_id, name, underlying_type, location))
+
+# Cursor kind -> collect_* function (one dict lookup per node instead of an if/elif chain)
+DEFINITION_HANDLERS = {
+    CursorKind.MACRO_DEFINITION: collect_macro,
+    CursorKind.FUNCTION_DECL: collect_function,
+    CursorKind.VAR_DECL: collect_variable,
+    CursorKind.STRUCT_DECL: collect_struct_union,
+    CursorKind.UNION_DECL: collect_struct_union,
+    CursorKind.ENUM_DECL: collect_enum,
+    CursorKind.TYPEDEF_DECL: collect_typedef,
+}
+
+# ヘッダ解析と同じ定数 (変更なし)
+LEAF_KINDS = frozenset(kind.value for kind in (
+    CursorKind.FUNCTION_DECL,
+    CursorKind.CXX_METHOD,
+    CursorKind.CONSTRUCTOR,
+    CursorKind.DESTRUCTOR,
+    CursorKind.CONVERSION_FUNCTION,
+    CursorKind.FUNCTION_TEMPLATE,
+    CursorKind.VAR_DECL,
+    CursorKind.FIELD_DECL,
+    CursorKind.ENUM_DECL,
+    CursorKind.TYPEDEF_DECL,
+    CursorKind.TYPE_ALIAS_DECL,
+))
+
+# ヘッダ解析と同じ定数 (変更なし)
+CHILD_VISIT_BREAK = 0
+CHILD_VISIT_CONTINUE = 1
+CHILD_VISIT_RECURSE = 2
+
+# ヘッダ解析の定数に VAR_DECL (has_initializer が子を読む) を加えたもの
+CHILDREN_READ_KINDS = frozenset(kind.value for kind in (
+    CursorKind.STRUCT_DECL,
+    CursorKind.UNION_DECL,
+    CursorKind.ENUM_DECL,
+    CursorKind.VAR_DECL,
+))
+
+# ヘッダ解析と同じ定数 (変更なし)
+RECORD_KINDS = frozenset(kind.value for kind in (
+    CursorKind.STRUCT_DECL,
+    CursorKind.UNION_DECL,
+))
 
+# ヘッダ解析と同じ関数 (変更なし)
+@functools.lru_cache(maxsize=None)
+def main_file_check():
+    is_from_main_file = conf.lib.clang_Location_isFromMainFile
+    is_from_main_file.argtypes = [SourceLocation]
+    is_from_main_file.restype = ctypes.c_int
+    return is_from_main_file
+
+def traverse_ast(cursor, file_id, target_filepath, rows):
+    """Walk the AST and collect definitions into rows (table -> list of row tuples)
+
+    Only cursors in target_filepath (the main file of cursor's translation
+    unit) are recorded, so the basename used in locations is computed once
+    per call instead of per cursor.
+    Type spellings are interned so repeated types share one string object.
+    The tree is walked by libclang itself (clang_visitChildren), in the same
+    order as the former recursion; cursors outside the target file and function
+    contents are pruned on the C side, so deep ASTs cannot hit the recursion limit.
+    """
+    file_basename = os.path.basename(target_filepath)
+    # The target file is the translation unit's main file, so libclang can answer the
+    # file check itself (no File object, CXFile lookup or path comparison per cursor).
+    is_from_main_file = main_file_check()
+    # Dispatch on the raw kind id stored in the Cursor struct (Cursor.kind calls CursorKind.from_id)
+    handlers = {kind.value: handler for kind, handler in DEFINITION_HANDLERS.items()}
+    children_read_kinds = CHILDREN_READ_KINDS
+    record_kinds = RECORD_KINDS
+    leaf_kinds = LEAF_KINDS
+    visit_children = conf.lib.clang_visitChildren
+    tu = cursor._tu
+    errors = []
+
+    def visit(child):
+        # Determine if the cursor is in the target file or a related header
+        if not is_from_main_file(child.location):
+            return CHILD_VISIT_CONTINUE # Declared in an included header: nothing below it belongs to this file
+
+        # --- Handle definitions (mainly file scope or class scope) ---
+        # Every handler needs the cursor to be in the current file; the scope is checked by the handler
+        kind_id = child._kind_id
+        handler = handlers.get(kind_id)
+        if handler:
+            children = list(child.get_children()) if kind_id in children_read_kinds else ()
+            handler(child, file_id, file_basename, rows, children)
+            if kind_id in record_kinds:
+                # Members come from the list already built; libclang does not visit them again
+                for member in children:
+                    if visit(member) == CHILD_VISIT_RECURSE:
+                        visit_children(member, visitor_callback, None)
+                    if errors:
+                        return CHILD_VISIT_BREAK
+                return CHILD_VISIT_CONTINUE
+
+        # --- Traverse child nodes ---
+        # Function bodies only hold local declarations, which the is_file_scope/is_class_scope
+        # checks would reject anyway, so do not descend into functions (or other LEAF_KINDS).
+        # Namespaces, classes and other containers are still traversed.
+        return CHILD_VISIT_CONTINUE if kind_id in leaf_kinds else CHILD_VISIT_RECURSE
+
+    def visitor(child, parent, client_data):
+        try:
+            child._tu = tu # Keep the TU alive as long as the cursor (as Cursor.get_children does)
+            return visit(child)
+        except BaseException as e:
+            # An exception cannot cross the C frames; stop the walk and re-raise it below
+            errors.append(e)
+            return CHILD_VISIT_BREAK
+
+    visitor_callback = callbacks['cursor_visit'](visitor)
+    visit_children(cursor, visitor_callback, None)
+    if errors:
+        raise errors[0]
 
-    # --- Handle definitions (mainly file scope or class scope) ---
-
-    # Macro (defined in the file)
-    # Check cursor.location to determine file
-    if cursor.kind == CursorKind.MACRO_DEFINITION and in_target_file:
-        name = cursor.spelling
-        body = get_macro_body(cursor)
-        location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-        if name:
-            db_cursor.execute("INSERT INTO macros (file_id, name, body, location) VALUES (?, ?, ?, ?)",
-                              (file_id, name, body, location))
-
-    # Function (file scope or class scope)
-    elif cursor.kind == CursorKind.FUNCTION_DECL and (is_file_scope or is_class_scope):
-         # In .cpp files, functions may be declared in headers and defined in .cpp files, appearing in both.
-         # Use in_target_file to focus on definitions/declarations in the current file.
-        if in_target_file:
-            name = cursor.spelling
-            if not name: # Skip unnamed functions
-                return
-
-            return_type = cursor.result_type.spelling
-            params = get_function_params(cursor)
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-            is_definition = cursor.is_definition() # Has body (is a definition)
-            storage_class = cursor.storage_class
-            is_static = storage_class == StorageClass.STATIC
-
-            # C++ constructors/destructors may not have a return type
-            if not return_type and parent_kind in ['CLASS_DECL', 'STRUCT_DECL']:
-                 if name == parent_name: # Constructor
-                     return_type = "(constructor)"
-                 elif name == f"~{parent_name}": # Destructor
-                     return_type = "(destructor)"
-
-            # print(f" Found Function: {name} (static={is_static}, def={is_definition}) in {parent_kind}:{parent_name} at {location}")
-            db_cursor.execute(
-                "INSERT INTO functions (file_id, name, return_type, parameters, is_declaration, is_static, parent_kind, parent_name, location) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (file_id, name, return_type, params, 0 if is_definition else 1, 1 if is_static else 0, parent_kind if is_class_scope else None, parent_name if is_class_scope else None, location)
-            )
-
-    # Global variables / file static variables (file scope only)
-    elif cursor.kind == CursorKind.VAR_DECL and is_file_scope:
-        if in_target_file:
-            name = cursor.spelling
-            if not name: # Skip unnamed variables
-                return
+# ヘッダ解析と同じ関数 (変更なし)
+def insert_definitions(conn, rows, cursor=None):
+    if cursor is None:
+        cursor = conn.cursor()
+    for table, table_rows in rows.items():
+        if table_rows:
+            cursor.executemany(INSERT_DEFINITION_SQL[table], table_rows)
 
-            var_type = cursor.type.spelling
-            storage_class = cursor.storage_class
-            is_extern = storage_class == StorageClass.EXTERN
-            is_static = storage_class == StorageClass.STATIC
-            init = has_initializer(cursor)
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-
-            # print(f" Found Variable: {name} (static={is_static}, extern={is_extern}, init={init}) at {location}")
-            db_cursor.execute(
-                "INSERT INTO variables (file_id, name, type, is_extern, is_static, has_initializer, location) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (file_id, name, var_type, 1 if is_extern else 0, 1 if is_static else 0, init, location)
-            )
-
-    # Structs/unions (file scope) - usually defined in headers, but also possible in .c/.cpp files
-    elif cursor.kind == CursorKind.STRUCT_DECL and is_file_scope:
-        if in_target_file and cursor.is_definition(): # Record only definitions
-            name = cursor.spelling or None
-            kind = 'struct'
-            members = get_struct_union_members(cursor)
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-            db_cursor.execute("INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
-                              (file_id, kind, name, members, location))
-
-    elif cursor.kind == CursorKind.UNION_DECL and is_file_scope:
-        if in_target_file and cursor.is_definition():
-            name = cursor.spelling or None
-            kind = 'union'
-            members = get_struct_union_members(cursor)
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-            db_cursor.execute("INSERT INTO structs_unions (file_id, kind, name, members, location) VALUES (?, ?, ?, ?, ?)",
-                              (file_id, kind, name, members, location))
-
-    # Enums (file scope)
-    elif cursor.kind == CursorKind.ENUM_DECL and is_file_scope:
-        if in_target_file and cursor.is_definition():
-            name = cursor.spelling or None
-            constants = get_enum_constants(cursor)
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-            db_cursor.execute("INSERT INTO enums (file_id, name, constants, location) VALUES (?, ?, ?, ?)",
-                              (file_id, name, constants, location))
-
-    # Typedefs (file scope)
-    elif cursor.kind == CursorKind.TYPEDEF_DECL and is_file_scope:
-        if in_target_file:
-            name = cursor.spelling
+# ヘッダ解析と同じ関数 (変更なし)
+@contextlib.contextmanager
+def background_writer(conn, cursor=None, max_pending=16):
+    if cursor is None:
+        cursor = conn.cursor()
+    pending = queue.Queue(maxsize=max_pending)
+    errors = []
+
+    def run():
+        while True:
+            rows = pending.get()
+            if rows is None:
+                break
+            if errors:
+                continue
             try:
-                 underlying_type = cursor.underlying_typedef_type.spelling
-            except Exception:
-                 underlying_type = "unknown" # Handle cases where underlying type can't be retrieved
-            location = f"{os.path.basename(cursor.location.file.name)}:{cursor.location.line}:{cursor.location.column}"
-            db_cursor.execute("INSERT INTO typedefs (file_id, name, underlying_type, location) VALUES (?, ?, ?, ?)",
-                              (file_id, name, underlying_type, location))
+                insert_definitions(conn, rows, cursor)
+            except BaseException as e:
+                errors.append(e)
 
-
-    # --- Recursively traverse child nodes ---
-    # By default, do not traverse inside functions or classes (focus on file/class scope definitions)
-    # However, for namespaces and similar, further traversal may be needed.
-    # Here, we simply traverse all top-level child nodes.
-    # (Local variables inside functions, etc., are excluded by the is_file_scope/is_class_scope checks above)
-    for child in cursor.get_children():
-        traverse_ast(child, db_conn, file_id, target_filepath)
+    writer = threading.Thread(target=run, name="definition-writer", daemon=True)
+    writer.start()
+    try:
+        yield pending.put
+    finally:
+        pending.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
 
 
 # --- メイン処理 ---
-def main():
-    parser = argparse.ArgumentParser(description='Parse C/C++ implementation file (.c, .cpp) and store definitions in SQLite.')
-    parser.add_argument('source_file', help='Path to the C/C++ source file to parse.')
-    # デフォルトDB名を変更
-    parser.add_argument('-db', '--database', default='implementations.db', help='Path to the SQLite database file (default: implementations.db).')
-    parser.add_argument('-I', '--include', action='append', default=[], help='Add directory to include search path (crucial for resolving types).')
-    parser.add_argument('-D', '--define', action='append', default=[], help='Define a macro (e.g., -DNDEBUG).')
-    parser.add_argument('--libclang', help=f'Path to libclang library file (e.g., {LIBCLANG_PATH or "/path/to/libclang.so"})')
-    parser.add_argument('--lang', choices=['c', 'c++'], default=None, help='Force language standard (e.g., c++11). Tries to guess from extension if not provided.')
-    parser.add_argument('--std', default=None, help='Set C/C++ standard (e.g., c11, c++17).')
 
+# ヘッダ解析と同じ関数 (変更なし)
+def configure_libclang(libclang_path):
+    if libclang_path and os.path.exists(libclang_path) and not Config.loaded:
+        Config.set_library_file(libclang_path)
 
-    args = parser.parse_args()
-
-    source_filepath = args.source_file
-    db_filepath = args.database
-    clang_args = []
-
-    # インクルードパス (実装ファイル解析では特に重要)
-    for include_dir in args.include:
-        clang_args.append(f'-I{include_dir}')
+# ヘッダ解析と同じ関数 (変更なし)
+def expand_input_paths(paths):
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                filepaths.extend(
+                    os.path.join(dirpath, filename) for filename in sorted(filenames)
+                    if filename.endswith(INPUT_EXTENSIONS)
+                )
+        elif glob.has_magic(path):
+            filepaths.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            filepaths.append(path)
+    return list(dict.fromkeys(cached_abspath(filepath) for filepath in filepaths))
 
-    # マクロ定義
-    for define_macro in args.define:
-        clang_args.append(f'-D{define_macro}')
+def build_clang_args(args, source_filepath):
+    """コマンドライン引数とファイルの拡張子からClangに渡す引数を組み立てる"""
+    # インクルードパス (実装ファイル解析では特に重要) とマクロ定義
+    # 警告も表示するので -w は付けない
+    clang_args = [f'-I{include_dir}' for include_dir in args.include]
+    clang_args += [f'-D{define_macro}' for define_macro in args.define]
 
     # 言語と標準
     language = args.lang
@@ -429,16 +704,114 @@ def main():
         if args.std:
             clang_args.append(f'-std={args.std}')
 
+    return clang_args
+
+# ヘッダ解析と同じ関数 (変更なし)
+@functools.lru_cache(maxsize=None)
+def shared_index():
+    return Index.create()
+
+# ヘッダ解析と同じ関数 (変更なし)
+def ast_cache_path(ast_cache_dir, filepath, clang_args, parse_options=0):
+    key = "\0".join([os.path.abspath(filepath), str(parse_options), *clang_args])
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(ast_cache_dir, f"{os.path.basename(filepath)}.{digest}.ast")
+
+# ヘッダ解析と同じ関数 (変更なし)
+def load_or_parse_tu(index, filepath, clang_args, parse_options, ast_cache_dir=None):
+    if not ast_cache_dir:
+        return index.parse(filepath, args=clang_args, options=parse_options)
+
+    cache_path = ast_cache_path(ast_cache_dir, filepath, clang_args, parse_options)
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(filepath):
+            return TranslationUnit.from_ast_file(cache_path, index)
+    except (OSError, TranslationUnitLoadError):
+        pass
+
+    tu = index.parse(filepath, args=clang_args, options=parse_options)
+    try:
+        os.makedirs(ast_cache_dir, exist_ok=True)
+        tu.save(cache_path)
+    except (OSError, TranslationUnitSaveError) as e:
+        print(f"Warning: Could not save AST cache {cache_path}: {e}", file=sys.stderr)
+    return tu
+
+def parse_one(source_filepath, file_id, clang_args, ast_cache_dir=None, collect_macros=True):
+    """1つの実装ファイルをパースし、DBに挿入する行をテーブルごとに返す (DB接続は使わない)"""
+    # Clangインデックス (プロセス内の全ファイルで共有する)
+    index = shared_index()
+
+    # 実装ファイルをパース
+    # PARSE_SKIP_FUNCTION_BODIES を *削除* して is_definition() の精度を上げる
+    # (本体の内容自体はDBに保存しないが、定義かどうかの判定に使う)
+    # PARSE_DETAILED_PROCESSING_RECORD: マクロ定義のカーソルを得るために必要 (--no-macros では付けない)
+    parse_options = TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD if collect_macros else 0
+    print(f"Parsing source file {source_filepath} (this may take a moment)...")
+    # --ast-cache 指定時は、変更のないファイルをパースせずキャッシュから読み込む
+    tu = load_or_parse_tu(index, source_filepath, clang_args, parse_options, ast_cache_dir)
+
+    # パースエラーチェック
+    has_errors = False
+    for diag in tu.diagnostics:
+         # Warning 以上を表示 (Info, Ignored は除外)
+        if diag.severity >= diag.Warning:
+            severity_str = {
+                diag.Ignored: "Ignored", diag.Note: "Note", diag.Warning: "Warning",
+                diag.Error: "Error", diag.Fatal: "Fatal"
+            }.get(diag.severity, "Unknown")
+            loc = diag.location
+            loc_str = f"{loc.file}:{loc.line}:{loc.column}" if loc and loc.file else "(no location)"
+            print(f"Parse {severity_str}: {diag.spelling} at {loc_str}", file=sys.stderr)
+            if diag.severity >= diag.Error:
+                has_errors = True
+
+    if has_errors:
+        print("Errors occurred during parsing. Results might be incomplete.", file=sys.stderr)
+        # エラーがあっても続行する
+
+    # ASTを走査して定義を収集
+    rows = new_definition_rows()
+    traverse_ast(tu.cursor, file_id, os.path.abspath(source_filepath), rows)
+    return rows
 
-    print(f"Parsing: {source_filepath}")
+def main():
+    parser = argparse.ArgumentParser(description='Parse C/C++ implementation file (.c, .cpp) and store definitions in SQLite.')
+    parser.add_argument('source_files', nargs='+', metavar='source_file', help='Path to the C/C++ source file to parse (multiple files, directories and glob patterns allowed).')
+    # デフォルトDB名を変更
+    parser.add_argument('-db', '--database', default='implementations.db', help='Path to the SQLite database file (default: implementations.db).')
+    parser.add_argument('-I', '--include', action='append', default=[], help='Add directory to include search path (crucial for resolving types).')
+    parser.add_argument('-D', '--define', action='append', default=[], help='Define a macro (e.g., -DNDEBUG).')
+    parser.add_argument('--libclang', help=f'Path to libclang library file (e.g., {LIBCLANG_PATH or "/path/to/libclang.so"})')
+    parser.add_argument('--lang', choices=['c', 'c++'], default=None, help='Force language standard (e.g., c++11). Tries to guess from extension if not provided.')
+    parser.add_argument('--std', default=None, help='Set C/C++ standard (e.g., c11, c++17).')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of worker processes used when parsing multiple files (default: number of CPUs).')
+    parser.add_argument('--ast-cache', metavar='DIR', default=None, help='Directory for cached ASTs; unchanged files are loaded from the cache instead of being reparsed.')
+    parser.add_argument('--skip-unchanged', action='store_true', help='Skip files whose content and parse settings (clang arguments, --no-macros) match the previous --skip-unchanged run.')
+    parser.add_argument('--no-macros', action='store_true', help='Do not collect macros. Parsing without the detailed preprocessing record is faster and uses less memory.')
+
+
+    args = parser.parse_args()
+
+    source_filepaths = expand_input_paths(args.source_files)
+    if not source_filepaths:
+        print("Error: No input files found.", file=sys.stderr)
+        sys.exit(1)
+    db_filepath = args.database
+    jobs = []
+
+    for source_filepath in source_filepaths:
+        clang_args = build_clang_args(args, source_filepath)
+        jobs.append((source_filepath, clang_args))
+        print(f"Parsing: {source_filepath}")
+        print(f"Clang Args: {' '.join(clang_args)}")
     print(f"Database: {db_filepath}")
-    print(f"Clang Args: {' '.join(clang_args)}")
 
     # libclangのパス設定
     libclang_path_to_use = args.libclang or LIBCLANG_PATH
     if libclang_path_to_use:
         if os.path.exists(libclang_path_to_use):
-            Config.set_library_file(libclang_path_to_use)
+            configure_libclang(libclang_path_to_use)
             print(f"Using libclang: {libclang_path_to_use}")
         else:
             print(f"Warning: Specified libclang path not found: {libclang_path_to_use}", file=sys.stderr)
@@ -446,54 +819,76 @@ def main():
     else:
          print("Attempting to find libclang automatically...")
 
+    source_filepath = None
     try:
-        # Clangインデックス作成
-        index = Index.create()
-
-        # 実装ファイルをパース
-        # PARSE_SKIP_FUNCTION_BODIES を *削除* して is_definition() の精度を上げる
-        # (本体の内容自体はDBに保存しないが、定義かどうかの判定に使う)
-        parse_options = 0
-        print("Parsing source file (this may take a moment)...")
-        tu = index.parse(
-            source_filepath,
-            args=clang_args,
-            options=parse_options
-        )
-
-        # パースエラーチェック
-        has_errors = False
-        for diag in tu.diagnostics:
-             # Warning 以上を表示 (Info, Ignored は除外)
-            if diag.severity >= diag.Warning:
-                severity_str = {
-                    diag.Ignored: "Ignored", diag.Note: "Note", diag.Warning: "Warning",
-                    diag.Error: "Error", diag.Fatal: "Fatal"
-                }.get(diag.severity, "Unknown")
-                loc = diag.location
-                loc_str = f"{loc.file}:{loc.line}:{loc.column}" if loc and loc.file else "(no location)"
-                print(f"Parse {severity_str}: {diag.spelling} at {loc_str}", file=sys.stderr)
-                if diag.severity >= diag.Error:
-                    has_errors = True
-
-        if has_errors:
-            print("Errors occurred during parsing. Results might be incomplete.", file=sys.stderr)
-            # エラーがあっても続行する
-
         # データベース接続とセットアップ
-        conn = setup_database(db_filepath)
-
-        # ファイルレコードを追加/更新し、ファイルIDを取得
-        target_filepath_abs = os.path.abspath(source_filepath)
-        file_id = add_file_record(conn, source_filepath)
+        # DBファイルがまだなければメモリ上に作り、最後に一度だけディスクに書き出す (行ごとのページ書き込みを避ける)
+        build_in_memory = db_filepath != ':memory:' and not os.path.exists(db_filepath)
+        conn = setup_database(':memory:' if build_in_memory else db_filepath)
+        # 1回の実行で使うカーソルは1つだけ作って各ヘルパーで使い回す
+        db_cursor = conn.cursor()
+
+        # 各ファイルの内容と解析設定のハッシュ (files.content_hash に保存し、--skip-unchanged の判定に使う)
+        # ファイル全体を読むので、--skip-unchanged のときだけ計算する (それ以外では content_hash は NULL になり、次回は必ず解析される)
+        content_hashes = {}
+        if args.skip_unchanged:
+            for source_filepath, clang_args in jobs:
+                parse_settings = [*clang_args, f"collect_macros={not args.no_macros}"]
+                content_hashes[cached_abspath(source_filepath)] = file_content_hash(source_filepath, parse_settings)
+            stored_hashes = get_stored_content_hashes(conn, source_filepaths, db_cursor)
+            unchanged = {filepath for filepath, content_hash in content_hashes.items()
+                         if stored_hashes.get(filepath) == content_hash}
+            for filepath in sorted(unchanged):
+                print(f"Unchanged, skipping: {filepath}")
+            jobs = [job for job in jobs if cached_abspath(job[0]) not in unchanged]
+            source_filepaths = [source_filepath for source_filepath, _ in jobs]
+            if not jobs:
+                print("All files are unchanged. Nothing to do.")
+                conn.close()
+                return
 
-        # ASTを走査して定義をDBに追加
-        print("Traversing AST and storing definitions...")
-        traverse_ast(tu.cursor, conn, file_id, target_filepath_abs)
+        # ファイル登録から定義の挿入までを1トランザクションで行う (成功時にコミット、例外時はロールバック)
+        with conn:
+            # ファイルが1つも登録されていなければ、空のDBへの最初の一括登録
+            initial_load = not db_cursor.execute("SELECT EXISTS (SELECT 1 FROM files)").fetchone()[0]
+            # ファイルレコードを一括で追加/更新し、ファイルIDを取得
+            file_ids = add_file_records(conn, source_filepaths, db_cursor, content_hashes)
+
+            # ASTを走査して定義をDBに追加
+            # パースは各ファイル独立なのでワーカープロセスで並列に行い、DBへの書き込みはこのプロセスだけが行う
+            print("Traversing AST and storing definitions...")
+            # 空のDBに複数ファイルを登録する場合は検索用インデックスを外して挿入し、最後に一度だけ作り直す
+            # 既存のDBの一部を更新する場合は、全行からのインデックス再作成の方が高くつくので外さない
+            if initial_load and len(jobs) > 1:
+                index_guard = suspended_indexes(conn, BULK_LOAD_SUSPENDED_INDEXES)
+            else:
+                index_guard = contextlib.nullcontext()
+            # 挿入は書き込みスレッドで行い、次のファイルのパースと重ねる
+            with index_guard, background_writer(conn, db_cursor) as write_definitions:
+                if len(jobs) == 1 or args.jobs <= 1:
+                    for (source_filepath, clang_args), file_id in zip(jobs, file_ids):
+                        write_definitions(parse_one(source_filepath, file_id, clang_args, args.ast_cache, not args.no_macros))
+                else:
+                    with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs)),
+                                             initializer=configure_libclang,
+                                             initargs=(libclang_path_to_use,)) as executor:
+                        futures = {
+                            executor.submit(parse_one, source_filepath, file_id, clang_args, args.ast_cache, not args.no_macros): source_filepath
+                            for (source_filepath, clang_args), file_id in zip(jobs, file_ids)
+                        }
+                        for future in as_completed(futures):
+                            source_filepath = futures[future]
+                            write_definitions(future.result())
+
+            if initial_load:
+                # 作り直したインデックスの統計情報をクエリプランナー用に集める
+                db_cursor.execute("ANALYZE")
 
-        # データベースへの変更をコミット
-        conn.commit()
         print("Committing changes to database.")
+        # 閉じる前にクエリプランナーの統計を必要な分だけ更新する (メモリ上のDBなら書き出す前に)
+        db_cursor.execute("PRAGMA optimize")
+        if build_in_memory:
+            save_database(conn, db_filepath)
 
         # 接続を閉じる
         conn.close()
@@ -0,0 +1,113 @@
+import pytest
+from clang.cindex import Index, CursorKind, TranslationUnit
+
+from c_cxx_source_parser import header_parser, impl_parser
+
+SOURCE = """\
+#define MAX_SIZE 100
+#define SQUARE(x)   ((x) * (x))
+#define EMPTY
+"""
+
+
+@pytest.fixture(scope="module")
+def macros():
+    tu = Index.create().parse(
+        "macros.h",
+        args=["-x", "c"],
+        unsaved_files=[("macros.h", SOURCE)],
+        options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+    )
+    return {
+        c.spelling: c for c in tu.cursor.get_children()
+        if c.kind == CursorKind.MACRO_DEFINITION and c.location.file
+    }
+
+
+@pytest.mark.parametrize("parser_module", [header_parser, impl_parser], ids=["header", "impl"])
+def test_get_macro_body_keeps_token_spacing(parser_module, macros):
+    assert parser_module.get_macro_body(macros["MAX_SIZE"]) == "100"
+    assert parser_module.get_macro_body(macros["SQUARE"]) == "(x)   ((x) * (x))"
+    assert parser_module.get_macro_body(macros["EMPTY"]) is None
+
+
+def test_header_parse_one_collects_rows_without_database(tmp_path):
+    header = tmp_path / "point.h"
+    header.write_text("typedef struct Point { int x; int y; } Point;\nextern int counter;\n")
+    rows = header_parser.parse_one(str(header), 7, ["-x", "c"])
+    assert list(rows["structs_unions"].values()) == [(7, "struct", "Point", "int x; int y;", "point.h:1:16")]
+    assert list(rows["typedefs"].values()) == [(7, "Point", "struct Point", "point.h:1:40")]
+    assert list(rows["variables"].values()) == [(7, "counter", "int", 1, "point.h:2:12")]
+
+
+def test_impl_parse_one_collects_rows_without_database(tmp_path):
+    source = tmp_path / "main.c"
+    source.write_text("static int hidden = 1;\nint add(int a, int b) { return a + b; }\n")
+    rows = impl_parser.parse_one(str(source), 3, ["-x", "c"])
+    assert rows["variables"] == [(3, "hidden", "int", 0, 1, 1, "main.c:1:12")]
+    assert rows["functions"] == [(3, "add", "int", "int a, int b", 0, 0, None, None, "main.c:2:5")]
+
+
+def test_load_or_parse_tu_reuses_cached_ast(tmp_path):
+    header = tmp_path / "cached.h"
+    header.write_text("struct Cached { int value; };\n")
+    cache_dir = tmp_path / "cache"
+    index = Index.create()
+    header_parser.load_or_parse_tu(index, str(header), ["-x", "c"], 0, str(cache_dir))
+    assert len(list(cache_dir.iterdir())) == 1
+
+    def fail_parse(*args, **kwargs):
+        raise AssertionError("cached AST was not used")
+
+    index.parse = fail_parse
+    tu = header_parser.load_or_parse_tu(index, str(header), ["-x", "c"], 0, str(cache_dir))
+    assert [c.spelling for c in tu.cursor.get_children() if c.kind == CursorKind.STRUCT_DECL] == ["Cached"]
+
+
+@pytest.mark.parametrize("parser_module", [header_parser, impl_parser], ids=["header", "impl"])
+@pytest.mark.parametrize("source, failing_kind", [
+    ("struct Broken { int value; };\n", CursorKind.STRUCT_DECL),
+    ("struct Outer { union Broken { int value; } member; };\n", CursorKind.UNION_DECL),
+], ids=["top_level", "record_member"])
+def test_traverse_ast_propagates_handler_errors(parser_module, source, failing_kind, tmp_path, monkeypatch):
+    header = tmp_path / "broken.h"
+    header.write_text(source)
+    tu = Index.create().parse(str(header), args=["-x", "c"])
+
+    def fail(*args):
+        raise ValueError("handler failed")
+
+    monkeypatch.setitem(parser_module.DEFINITION_HANDLERS, failing_kind, fail)
+    with pytest.raises(ValueError, match="handler failed"):
+        parser_module.traverse_ast(tu.cursor, 1, str(header), parser_module.new_definition_rows())
+
+
+@pytest.mark.parametrize("parser_module", [header_parser, impl_parser], ids=["header", "impl"])
+def test_parse_one_collects_file_macros_only(parser_module, tmp_path):
+    header = tmp_path / "limits.h"
+    header.write_text("#define LIMIT 10\n#define TWICE(x) ((x) * 2)\n")
+    rows = parser_module.parse_one(str(header), 1, ["-x", "c", "-DFROM_COMMAND_LINE=1"])
+    macros = rows["macros"].values() if isinstance(rows["macros"], dict) else rows["macros"]
+    assert sorted(row[1] for row in macros) == ["LIMIT", "TWICE"]
+
+
+def test_impl_parse_one_records_typedef_struct_once(tmp_path):
+    source = tmp_path / "point.c"
+    source.write_text("typedef struct Point { int x; } Point;\n")
+    rows = impl_parser.parse_one(str(source), 1, ["-x", "c"])
+    assert [row[2] for row in rows["structs_unions"]] == ["Point"]
+
+
+def test_header_parse_one_collects_nested_records(tmp_path):
+    header = tmp_path / "nested.hpp"
+    header.write_text(
+        "struct Outer { union { int u1; char u2; } anon; struct Inner { int a; } in;"
+        " class Box { struct Deep { int v; } d; }; };\n")
+    rows = header_parser.parse_one(str(header), 1, ["-x", "c++"])
+    members = {key[0]: row[3] for key, row in rows["structs_unions"].items() if not key[0].startswith("(")}
+    assert members == {
+        "Outer": "union (unnamed union at %s:1:16) anon; struct Inner in;" % header,
+        "Inner": "int a;",
+        "Deep": "int v;",
+    }
+    assert len(rows["structs_unions"]) == 4
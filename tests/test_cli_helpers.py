@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from c_cxx_source_parser import header_parser, impl_parser
+
+
+@pytest.mark.parametrize("parser_module, expected", [
+    (header_parser, ["a.h", "sub/b.hpp"]),
+    (impl_parser, ["a.c", "sub/c.cpp"]),
+], ids=["header", "impl"])
+def test_expand_input_paths_walks_directories(parser_module, expected, tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("a.h", "a.c", "notes.txt", "sub/b.hpp", "sub/c.cpp"):
+        (tmp_path / name).write_text("")
+    paths = parser_module.expand_input_paths([str(tmp_path)])
+    assert [p[len(str(tmp_path)) + 1:] for p in paths] == expected
+
+
+def test_expand_input_paths_expands_globs_and_keeps_plain_paths(tmp_path):
+    for name in ("x.h", "y.h"):
+        (tmp_path / name).write_text("")
+    paths = header_parser.expand_input_paths([str(tmp_path / "*.h"), "missing.h"])
+    assert paths == [str(tmp_path / "x.h"), str(tmp_path / "y.h"), os.path.abspath("missing.h")]
+
+
+@pytest.mark.parametrize("parser_module", [header_parser, impl_parser], ids=["header", "impl"])
+def test_expand_input_paths_removes_overlapping_inputs(parser_module, tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("a.h", "sub/b.h"):
+        (tmp_path / name).write_text("")
+    paths = parser_module.expand_input_paths([
+        str(tmp_path / "sub" / "b.h"),
+        str(tmp_path),
+        str(tmp_path / "*.h"),
+        os.path.join(str(tmp_path), ".", "a.h"),
+    ])
+    assert paths == [str(tmp_path / "sub" / "b.h"), str(tmp_path / "a.h")]
+
+
+@pytest.mark.parametrize("parser_module, filename, source", [
+    (header_parser, "dup.h", "struct Point { int x; };\n#define MAX 1\n"),
+    (impl_parser, "dup.c", "int add(int a, int b) { return a + b; }\nstatic int s;\n"),
+], ids=["header", "impl"])
+def test_main_parses_duplicate_inputs_once(parser_module, filename, source, tmp_path, monkeypatch):
+    path = tmp_path / filename
+    path.write_text(source)
+
+    def row_counts(db_name, inputs):
+        db_path = str(tmp_path / db_name)
+        monkeypatch.setattr(sys, "argv", ["parser", *inputs, "-db", db_path, "-j", "1"])
+        parser_module.main()
+        conn = sqlite3.connect(db_path)
+        try:
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("files", *parser_module.DEFINITION_TABLES)}
+        finally:
+            conn.close()
+
+    once = row_counts("once.db", [str(path)])
+    twice = row_counts("twice.db", [str(path), os.path.join(str(tmp_path), ".", filename)])
+    assert once == twice
+    assert once["files"] == 1
+
+
+@pytest.mark.parametrize("parser_module, filename", [
+    (header_parser, "m.h"),
+    (impl_parser, "m.c"),
+], ids=["header", "impl"])
+def test_main_skip_unchanged_reparses_when_settings_change(parser_module, filename, tmp_path, monkeypatch, capsys):
+    path = tmp_path / filename
+    path.write_text("#define MAX 1\nint f(void) { return MAX; }\n")
+    db_path = str(tmp_path / "defs.db")
+
+    def run(*options):
+        monkeypatch.setattr(sys, "argv", ["parser", str(path), "-db", db_path, "-j", "1", "--skip-unchanged", *options])
+        parser_module.main()
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM macros").fetchone()[0]
+        finally:
+            conn.close()
+
+    assert run("--no-macros") == 0
+    assert run() == 1  # macro collection changed, so the file is parsed again
+    capsys.readouterr()
+    assert run() == 1
+    assert "Unchanged, skipping" in capsys.readouterr().out
+    run("-D", "X=1")  # clang arguments changed, so the file is parsed again
+    assert "Unchanged, skipping" not in capsys.readouterr().out
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import pytest
+
+from c_cxx_source_parser import header_parser, impl_parser
+
+
+@pytest.fixture(params=[header_parser, impl_parser], ids=["header", "impl"])
+def parser_module(request):
+    return request.param
+
+
+@pytest.fixture
+def conn(parser_module, tmp_path):
+    conn = parser_module.setup_database(str(tmp_path / "test.db"))
+    yield conn
+    conn.close()
+
+
+def test_add_file_records_returns_ids_in_input_order(parser_module, conn, tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.h", "b.h", "c.h")]
+    ids = parser_module.add_file_records(conn, paths)
+    assert len(set(ids)) == 3
+    rows = dict(conn.execute("SELECT filepath, id FROM files").fetchall())
+    assert [rows[os.path.abspath(p)] for p in paths] == ids
+
+
+def test_add_file_records_reuses_ids_and_clears_definitions(parser_module, conn, tmp_path):
+    path = str(tmp_path / "a.h")
+    with conn:
+        first_id = parser_module.add_file_record(conn, path)
+    conn.execute("INSERT INTO macros (file_id, name, body, location) VALUES (?, ?, ?, ?)",
+                 (first_id, "FOO", "1", "a.h:1:9"))
+    conn.commit()
+
+    with conn:
+        ids = parser_module.add_file_records(conn, [path, str(tmp_path / "b.h")])
+        assert conn.in_transaction  # helpers leave the commit to the caller
+    assert ids[0] == first_id
+    assert conn.execute("SELECT COUNT(*) FROM macros").fetchone()[0] == 0
+    assert not conn.in_transaction
+
+
+def test_connect_applies_pragmas(parser_module, tmp_path):
+    conn = parser_module.connect(str(tmp_path / "pragmas.db"))
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_setup_database_indexes_file_id(parser_module, conn):
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    for table in parser_module.DEFINITION_TABLES:
+        assert f"idx_{table}_file_id" in indexes
+
+
+def test_suspended_indexes_recreates_original_definitions(parser_module, conn):
+    def index_sqls():
+        return dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"))
+
+    before = index_sqls()
+    with parser_module.suspended_indexes(conn, parser_module.BULK_LOAD_SUSPENDED_INDEXES):
+        during = index_sqls()
+        assert not set(parser_module.BULK_LOAD_SUSPENDED_INDEXES) & set(during)
+        assert "idx_macros_file_id" in during
+    assert index_sqls() == before
+
+
+def test_add_file_records_stores_content_hash(parser_module, conn, tmp_path):
+    path = tmp_path / "a.h"
+    path.write_text("int a;\n")
+    hashes = {os.path.abspath(path): parser_module.file_content_hash(str(path))}
+    with conn:
+        parser_module.add_file_records(conn, [str(path)], content_hashes=hashes)
+    assert parser_module.get_stored_content_hashes(conn, [str(path)]) == hashes
+    empty = tmp_path / "empty.h"
+    empty.write_text("")
+    assert parser_module.file_content_hash(str(empty)) == \
+        "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    assert parser_module.file_content_hash(str(path), ["-DX=1"]) != hashes[os.path.abspath(path)]
+    assert parser_module.file_content_hash(str(path), ["-DX=1"]) != parser_module.file_content_hash(str(path), ["-DX=2"])
+
+
+def test_background_writer_inserts_and_reraises(parser_module, conn, tmp_path):
+    header = tmp_path / "foo.h"
+    header.write_text("struct Foo { int x; };\n")
+    with conn:
+        file_id = parser_module.add_file_record(conn, str(header))
+        with parser_module.background_writer(conn) as write_definitions:
+            write_definitions(parser_module.parse_one(str(header), file_id, ["-x", "c"]))
+    assert conn.execute("SELECT name FROM structs_unions").fetchall() == [("Foo",)]
+
+    with pytest.raises(KeyError):
+        with parser_module.background_writer(conn) as write_definitions:
+            write_definitions({"no_such_table": [(1,)]})
+
+
+def test_save_database_writes_memory_database_to_disk(parser_module, tmp_path):
+    memory_conn = parser_module.setup_database(":memory:")
+    with memory_conn:
+        parser_module.add_file_record(memory_conn, str(tmp_path / "a.h"))
+    db_path = str(tmp_path / "saved.db")
+    parser_module.save_database(memory_conn, db_path)
+    memory_conn.close()
+
+    disk_conn = sqlite3.connect(db_path)
+    try:
+        assert disk_conn.execute("SELECT filepath FROM files").fetchall() == [(str(tmp_path / "a.h"),)]
+        assert disk_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        disk_conn.close()